@@ -1,60 +1,133 @@
+import math
+import time
 import pygame
 import personallib.maths as maths
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Python 2D camera controller script
 # Manages camera functionality including panning and zooming the camera
-# Dependencies : pygame, personallib.maths
+# Batches of shapes can be culled and transformed in one vectorised step with the draw_rects, draw_circles and draw_lines methods
+# The view transform is cached, and only recalculated when the camera's position or zoom changes
+# Draw calls can be recorded into a RenderQueue with begin_queue, to be sorted by layer and issued together
+# Dependencies : math, time, pygame, collections, personallib.maths (optional: numpy)
 class Camera:
     def __init__(self, win: pygame.Surface, x: float, y: float, zoom: float):
-        self.zoom = zoom                        # Camera zoom such that zoom = pixels per coordinate increment
         self.win = win                          # Pygame window to draw onto
         self.winWidth = win.get_width()         # Pygame window width
         self.winHeight =  win.get_height()      # Pygame window height
-        self.width = self.winWidth / zoom       # Width of camera view
-        self.height = self.winHeight / zoom     # Height of camera view
-        self.x = x                              # X position of camera in world space
-        self.y = y                              # Y position of camera in world space
+        self._x = x                             # X position of camera in world space
+        self._y = y                             # Y position of camera in world space
+        self.zoom = zoom                        # Camera zoom such that zoom = pixels per coordinate increment
         self.smoothing = 0                      # Smoothing for camera follow
+        self.surfaceCache = SurfaceCache()      # Cache of scaled surfaces used by blit_scaled
+        self.queue = None                       # Render queue that draw calls are recorded into, if any
+        self.layer = 0                          # Layer that draw calls are recorded with
         self.bounds = ()                        # Coordinates for the camera follow boundaries
         self.active_bounds = (False, False,     # Toggle whether the camera follow boundaries should be enforced
                               False, False)
 
+    # X position of camera in world space
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self._x = value
+        self.update_transform()
+
+    # Y position of camera in world space
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        self._y = value
+        self.update_transform()
+
+    # Camera zoom such that zoom = pixels per coordinate increment
+    @property
+    def zoom(self):
+        return self._zoom
+
+    @zoom.setter
+    def zoom(self, value):
+        self._zoom = value
+        self.width = self.winWidth / value      # Width of camera view
+        self.height = self.winHeight / value    # Height of camera view
+        self.update_transform()
+
+    # Recalculates the cached view transform from the camera's position and zoom
+    # screen = (world - (left, top)) * zoom, and world = screen / zoom + (left, top)
+    def update_transform(self):
+        self.left = self._x - (self.width / 2)      # World space edges of the camera view
+        self.top = self._y - (self.height / 2)
+        self.right = self._x + (self.width / 2)
+        self.bottom = self._y + (self.height / 2)
+        self.viewMatrix = None                      # 3x3 view matrices, created when first requested
+        self.inverseViewMatrix = None
+
+    # Gets the view transform as a 3x3 matrix mapping homogeneous world coordinates to screen coordinates
+    def get_view_matrix(self):
+        if self.viewMatrix is None:
+            zoom = self._zoom
+            self.viewMatrix = maths.Matrix.from_rows([[zoom, 0, -self.left * zoom], [0, zoom, -self.top * zoom], [0, 0, 1]])
+        return self.viewMatrix
+
+    # Gets the inverse view transform as a 3x3 matrix mapping homogeneous screen coordinates to world coordinates
+    def get_inverse_view_matrix(self):
+        if self.inverseViewMatrix is None:
+            scale = 1 / self._zoom
+            self.inverseViewMatrix = maths.Matrix.from_rows([[scale, 0, self.left], [0, scale, self.top], [0, 0, 1]])
+        return self.inverseViewMatrix
+
+    # Applies a 3x3 matrix (such as the view matrix) to a batch of coordinates
+    @staticmethod
+    def transform_points(matrix, coords):
+        m = matrix.matrix
+        if np is not None:
+            points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+            return points @ np.asarray(m, dtype=np.float64)[:2, :2].T + np.asarray(m, dtype=np.float64)[:2, 2]
+        return [(m[0][0] * p[0] + m[0][1] * p[1] + m[0][2], m[1][0] * p[0] + m[1][1] * p[1] + m[1][2]) for p in coords]
+
     # Draws a rectangle to the screen
     def draw_rect(self, rect, colour):
         r = self.get_screen_rect(rect)
         if self.rect_in_bounds(rect):
-            pygame.draw.rect(self.win, colour, r)
+            self._drawer("rect")(colour, r)
 
     # Checks if a given rectangle is inside of the current camera view
     def rect_in_bounds(self, rect):
-        return (rect[0] <= self.x + (self.width / 2)) and (rect[0] + rect[2] >= self.x - (self.width / 2)) and (rect[1] + rect[3] >= self.y - (self.height / 2)) and (rect[1] <= self.y + (self.height / 2))
+        return (rect[0] <= self.right) and (rect[0] + rect[2] >= self.left) and (rect[1] + rect[3] >= self.top) and (rect[1] <= self.bottom)
 
     # Gets the coordinates and dimensions of a given rectangle as screen coordinates
     def get_screen_rect(self, rect):
-        w = rect[2] * self.zoom
-        h = rect[3] * self.zoom
-        x = (-self.x * self.zoom) + ((rect[0] + (self.width / 2)) * self.zoom)
-        y = (-self.y * self.zoom) + ((rect[1] + (self.height / 2)) * self.zoom)
-        return (x, y, w, h)
+        zoom = self._zoom
+        return ((rect[0] - self.left) * zoom, (rect[1] - self.top) * zoom, rect[2] * zoom, rect[3] * zoom)
 
     # Draws a circle to the screen
     def draw_circle(self, centre, radius, colour):
         c, r = self.get_screen_circle(centre, radius)
         if self.circle_in_bounds(centre, radius):
-            pygame.draw.circle(self.win, colour, c, r)
+            self._drawer("circle")(colour, c, r)
 
     # Checks if a given circle is inside of the current camera view
     def circle_in_bounds(self, centre, radius):
-        return (centre[0] - radius <= self.x + (self.width / 2)) and (centre[0] + radius >= self.x - (self.width / 2)) and (centre[1] + radius >= self.y - (self.height / 2)) and (centre[1] - radius <= self.y + (self.height / 2))
+        return (centre[0] - radius <= self.right) and (centre[0] + radius >= self.left) and (centre[1] + radius >= self.top) and (centre[1] - radius <= self.bottom)
 
     # Gets the centre coordinates and radius of a given circle as screen coordinates
     def get_screen_circle(self, centre, radius):
-        r = radius * self.zoom
-        x = (-self.x * self.zoom) + ((centre[0] + (self.width / 2)) * self.zoom)
-        y = (-self.y * self.zoom) + ((centre[1] + (self.height / 2)) * self.zoom)
-        return (x, y), r
+        zoom = self._zoom
+        return ((centre[0] - self.left) * zoom, (centre[1] - self.top) * zoom), radius * zoom
 
     # Draws a line to the screen
+    # The line is clipped to the screen (plus its width) so that pygame only rasterises the visible part
     def draw_line(self, start, end, colour, width = 1):
         x = min(start[0], end[0])
         y = min(start[1], end[1])
@@ -62,53 +135,229 @@ class Camera:
         h = max(start[1], end[1]) - y
         rect = (x, y, w, h)
         if self.rect_in_bounds(rect):
-            pygame.draw.line(self.win, colour, self.get_screen_coord(start), self.get_screen_coord(end), width)
+            clipped = maths.clip_line(self.get_screen_coord(start), self.get_screen_coord(end), (-width, -width, self.winWidth + (2 * width), self.winHeight + (2 * width)))
+            if clipped is not None:
+                self._drawer("line")(colour, clipped[0], clipped[1], width)
+
+    # Draws a batch of rectangles to the screen, culling and transforming the whole batch at once
+    # The colour can be a single colour or one colour per rectangle
+    def draw_rects(self, rects, colour):
+        left, top, right, bottom = self.get_view_bounds()
+        zoom = self._zoom
+        if np is not None:
+            r = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+            visible = np.flatnonzero((r[:, 0] <= right) & (r[:, 0] + r[:, 2] >= left) & (r[:, 1] + r[:, 3] >= top) & (r[:, 1] <= bottom))
+            r = r[visible]
+            screenRects = np.column_stack(((r[:, 0] - left) * zoom, (r[:, 1] - top) * zoom, r[:, 2] * zoom, r[:, 3] * zoom)).tolist()
+        else:
+            visible = [i for i, rect in enumerate(rects) if rect[0] <= right and rect[0] + rect[2] >= left and rect[1] + rect[3] >= top and rect[1] <= bottom]
+            screenRects = [((rects[i][0] - left) * zoom, (rects[i][1] - top) * zoom, rects[i][2] * zoom, rects[i][3] * zoom) for i in visible]
+        draw = self._drawer("rect")
+        for screenRect, c in zip(screenRects, Camera._batch_colours(colour, visible)):
+            draw(c, screenRect)
+
+    # Draws a batch of circles to the screen, culling and transforming the whole batch at once
+    # The radius and colour can be single values or one per circle
+    def draw_circles(self, centres, radius, colour):
+        left, top, right, bottom = self.get_view_bounds()
+        zoom = self._zoom
+        if np is not None:
+            c = np.asarray(centres, dtype=np.float64).reshape(-1, 2)
+            r = np.broadcast_to(np.asarray(radius, dtype=np.float64), (len(c),))
+            visible = np.flatnonzero((c[:, 0] - r <= right) & (c[:, 0] + r >= left) & (c[:, 1] + r >= top) & (c[:, 1] - r <= bottom))
+            screenCentres = ((c[visible] - (left, top)) * zoom).tolist()
+            screenRadii = (r[visible] * zoom).tolist()
+        else:
+            radii = radius if isinstance(radius, (list, tuple)) else [radius] * len(centres)
+            visible = [i for i, (centre, r) in enumerate(zip(centres, radii)) if centre[0] - r <= right and centre[0] + r >= left and centre[1] + r >= top and centre[1] - r <= bottom]
+            screenCentres = [((centres[i][0] - left) * zoom, (centres[i][1] - top) * zoom) for i in visible]
+            screenRadii = [radii[i] * zoom for i in visible]
+        draw = self._drawer("circle")
+        for centre, r, c in zip(screenCentres, screenRadii, Camera._batch_colours(colour, visible)):
+            draw(c, centre, r)
 
+    # Draws a batch of lines to the screen, culling and transforming the whole batch at once
+    # The colour can be a single colour or one colour per line
+    def draw_lines(self, starts, ends, colour, width = 1):
+        left, top, right, bottom = self.get_view_bounds()
+        zoom = self._zoom
+        if np is not None:
+            s = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+            e = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+            low = np.minimum(s, e)
+            high = np.maximum(s, e)
+            visible = np.flatnonzero((low[:, 0] <= right) & (high[:, 0] >= left) & (high[:, 1] >= top) & (low[:, 1] <= bottom))
+            screenStarts = ((s[visible] - (left, top)) * zoom).tolist()
+            screenEnds = ((e[visible] - (left, top)) * zoom).tolist()
+        else:
+            visible = [i for i, (start, end) in enumerate(zip(starts, ends)) if min(start[0], end[0]) <= right and max(start[0], end[0]) >= left and max(start[1], end[1]) >= top and min(start[1], end[1]) <= bottom]
+            screenStarts = [((starts[i][0] - left) * zoom, (starts[i][1] - top) * zoom) for i in visible]
+            screenEnds = [((ends[i][0] - left) * zoom, (ends[i][1] - top) * zoom) for i in visible]
+        draw = self._drawer("line")
+        screen = (-width, -width, self.winWidth + (2 * width), self.winHeight + (2 * width))
+        for start, end, c in zip(screenStarts, screenEnds, Camera._batch_colours(colour, visible)):
+            clipped = maths.clip_line(start, end, screen)
+            if clipped is not None:
+                draw(c, clipped[0], clipped[1], width)
+
+    # Gets the colours for the visible items of a batch, from either a single colour or a colour per item
+    @staticmethod
+    def _batch_colours(colour, visible):
+        if Camera._single_colour(colour):
+            return [colour] * len(visible)
+        return [colour[i] for i in visible]
+
+    # Checks whether a batch colour argument is one colour rather than a colour per item
+    @staticmethod
+    def _single_colour(colour):
+        return isinstance(colour, pygame.Color) or isinstance(colour, str) or (len(colour) in (3, 4) and not hasattr(colour[0], "__len__"))
+
+    # Draws a polygon to the screen
+    # Polygons whose bounding box is outside the view are skipped, and those partly outside are clipped to the screen
     def draw_polygon(self, points, colour):
+        xs = [point[0] for point in points]
+        ys = [point[1] for point in points]
+        left = min(xs)
+        top = min(ys)
+        right = max(xs)
+        bottom = max(ys)
+        if not self.rect_in_bounds((left, top, right - left, bottom - top)):
+            return
         screenPoints = [ self.get_screen_coord(point) for point in points]
-        pygame.draw.polygon(self.win, colour, screenPoints)
+        if left < self.left or right > self.right or top < self.top or bottom > self.bottom:
+            screenPoints = maths.clip_polygon(screenPoints, (0, 0, self.winWidth, self.winHeight))
+            if len(screenPoints) < 3:
+                return
+        self._drawer("polygon")(colour, screenPoints)
 
     # Gets the given coordinate as a screen coordinate
     def get_screen_coord(self, coord):
-        x = (coord[0] + (self.width / 2) - self.x) * self.zoom
-        y = (coord[1] + (self.height / 2) - self.y) * self.zoom
-        return (x, y)
+        return ((coord[0] - self.left) * self._zoom, (coord[1] - self.top) * self._zoom)
+
+    # Gets a batch of coordinates as screen coordinates, as an N x 2 array with NumPy or a list of tuples without
+    def get_screen_coords(self, coords):
+        left = self.left
+        top = self.top
+        zoom = self._zoom
+        if np is not None:
+            return (np.asarray(coords, dtype=np.float64).reshape(-1, 2) - (left, top)) * zoom
+        return [((coord[0] - left) * zoom, (coord[1] - top) * zoom) for coord in coords]
+
+    # Gets the objects in a spatial index (such as a maths.SpatialHash) that overlap the camera view
+    # Only the index cells covered by the view are visited, so objects far off screen cost nothing
+    def query_visible(self, index):
+        return index.query_rect(self.get_view_rect())
+
+    # Gets the camera view in world space as a rectangle (x, y, width, height)
+    def get_view_rect(self):
+        return (self.left, self.top, self.width, self.height)
+
+    # Gets the world space edges of the camera view as (left, top, right, bottom)
+    def get_view_bounds(self):
+        return (self.left, self.top, self.right, self.bottom)
 
     # Gets the given coordinate as a world coordinate
     def get_world_coord(self, coord):
-        x = (coord[0] / self.zoom) + self.x - (self.width / 2)
-        y = (coord[1] / self.zoom) + self.y - (self.height / 2)
-        return (x, y)
+        return ((coord[0] / self._zoom) + self.left, (coord[1] / self._zoom) + self.top)
 
     # Blits a surface onto the screen
     def blit(self, source, dest, area = None): 
         if self.rect_in_bounds(source.get_rect(topleft=dest)):
-            self.win.blit(source, self.get_screen_coord(dest), area=area)
+            self._drawer("blit")(source, self.get_screen_coord(dest), area)
+
+    # Blits a surface at a screen coordinate, for overlays that stay fixed as the camera moves
+    def blit_screen(self, source, dest, area = None):
+        self._drawer("blit")(source, dest, area)
+
+    # Blits a surface onto the screen scaled by the camera zoom, so that each source pixel covers one world unit
+    # The zoom is quantised by the surface cache, so scaled surfaces are reused while the zoom stays within a level,
+    # and the surface is placed on the grid of the quantised scale so that same sized surfaces that meet in the world meet on the screen
+    # Once the scaled area would be larger than the window, only the visible part of it is scaled, widened to blocks of
+    # about 128 screen pixels so that the scaled pieces are reused while panning
+    def blit_scaled(self, source, dest, area = None):
+        rect = source.get_rect()
+        if area is not None:
+            rect = rect.clip(area)
+        if rect.w == 0 or rect.h == 0 or not self.rect_in_bounds((dest[0], dest[1], rect.w, rect.h)):
+            return
+        width, height = source.get_size()
+        scale = self.surfaceCache.quantise(self._zoom)[1]
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        scaleX = size[0] / width
+        scaleY = size[1] / height
+        # Screen position of the source's top left corner, and of the edges of source pixels relative to it
+        originX = math.floor((dest[0] - rect.x - self._x) * scaleX + self.winWidth / 2 + 0.5)
+        originY = math.floor((dest[1] - rect.y - self._y) * scaleY + self.winHeight / 2 + 0.5)
+        snapX = lambda x: math.floor(x * scaleX + 0.5)
+        snapY = lambda y: math.floor(y * scaleY + 0.5)
+        x0, y0, x1, y1 = rect.left, rect.top, rect.right, rect.bottom
+        if size != (width, height) and rect.w * scaleX * rect.h * scaleY > self.winWidth * self.winHeight:
+            blockX = max(1, math.ceil(128 / scaleX))
+            blockY = max(1, math.ceil(128 / scaleY))
+            x0 = max(x0, math.floor(-originX / scaleX) // blockX * blockX)
+            y0 = max(y0, math.floor(-originY / scaleY) // blockY * blockY)
+            x1 = min(x1, -(-math.ceil((self.winWidth - originX) / scaleX) // blockX) * blockX)
+            y1 = min(y1, -(-math.ceil((self.winHeight - originY) / scaleY) // blockY) * blockY)
+            pieceSize = (snapX(x1) - snapX(x0), snapY(y1) - snapY(y0))
+            if pieceSize[0] <= 0 or pieceSize[1] <= 0:
+                return
+            piece = self.surfaceCache.get(source, pieceSize, (x0, y0, x1 - x0, y1 - y0))
+            self._drawer("blit")(piece, (originX + snapX(x0), originY + snapY(y0)), None)
+            return
+        scaled = self.surfaceCache.get(source, size)
+        if area is not None:
+            area = pygame.Rect(snapX(x0), snapY(y0), snapX(x1) - snapX(x0), snapY(y1) - snapY(y0))
+        self._drawer("blit")(scaled, (originX + snapX(x0), originY + snapY(y0)), area)
+
+    # Starts recording draw calls into a render queue instead of drawing them immediately
+    # A queue that is passed in is cleared first, so that one queue can be reused every frame
+    def begin_queue(self, queue = None):
+        if queue is None:
+            queue = RenderQueue()
+        else:
+            queue.clear()
+        self.queue = queue
+        return queue
+
+    # Sets the layer that draw calls are recorded with, where higher layers are drawn on top
+    def set_layer(self, layer):
+        self.layer = layer
+
+    # Draws everything recorded since begin_queue and stops recording
+    # The queue is returned with its commands kept, so that it can be inspected or replayed onto another surface
+    def flush_queue(self):
+        queue = self.queue
+        self.queue = None
+        if queue is not None:
+            queue.replay(self.win)
+        return queue
+
+    # Gets a function that issues a draw call of a given kind, either to the window or to the render queue
+    def _drawer(self, kind):
+        if self.queue is None:
+            function = RenderQueue.FUNCTIONS[kind]
+            win = self.win
+            return lambda *args: function(win, *args)
+        queue = self.queue
+        layer = self.layer
+        return lambda *args: queue.add(layer, kind, args)
 
     # Zooms out the camera by set amount
     def zoom_out(self, amount, limit = 1):
         self.zoom = max(self.zoom - amount, max(limit, 1))
-        self.width = self.winWidth / self.zoom
-        self.height = self.winHeight / self.zoom
     
     # Zooms in the camera by set amount
     def zoom_in(self, amount, limit = 1024):
         self.zoom = min(self.zoom + amount, min(limit, 1024))
-        self.width = self.winWidth / self.zoom
-        self.height = self.winHeight / self.zoom
 
     # Zooms out the camera by one step
     def zoom_out_step(self, limit = 1):
         self.zoom = max(self.zoom / 2, max(limit, 1))
         print(self.zoom)
-        self.width = self.winWidth / self.zoom
-        self.height = self.winHeight / self.zoom
     
     # Zooms in the camera by one step
     def zoom_in_step(self, limit = 1024):
         self.zoom = min(self.zoom * 2, limit) if limit > 0 else self.zoom * 2
-        self.width = self.winWidth / self.zoom
-        self.height = self.winHeight / self.zoom
     
     # Pans the camera by a given amount
     def pan(self, pos):
@@ -138,4 +387,333 @@ class Camera:
         if self.active_bounds[2] and self.y - (self.height / 2) <= self.bounds[0][1]:
             self.y = self.bounds[0][1] + (self.height / 2)
         if self.active_bounds[3] and self.y + (self.height / 2) >= self.bounds[1][1]:
-            self.y = self.bounds[1][1] - (self.height / 2)
\ No newline at end of file
+            self.y = self.bounds[1][1] - (self.height / 2)
+
+# Python CameraGroup object
+# Draws one scene to several cameras, such as a main view, a minimap and split screen views, sharing the culling work
+# Batches are culled once against the union of every view, and each camera then only transforms the survivors in bulk
+# Dependencies : pygame (optional: numpy)
+class CameraGroup:
+    def __init__(self, cameras = None):
+        self.cameras = list(cameras) if cameras is not None else []     # Cameras that the scene is drawn to
+
+    # Registers a camera with the group
+    def add_camera(self, cam):
+        self.cameras.append(cam)
+
+    # Removes a camera from the group
+    def remove_camera(self, cam):
+        self.cameras.remove(cam)
+
+    # Gets the world space edges of the union of every camera view as (left, top, right, bottom)
+    def get_union_bounds(self):
+        return (min(cam.left for cam in self.cameras), min(cam.top for cam in self.cameras),
+                max(cam.right for cam in self.cameras), max(cam.bottom for cam in self.cameras))
+
+    # Gets the union of every camera view as a rectangle (x, y, width, height)
+    def get_union_rect(self):
+        left, top, right, bottom = self.get_union_bounds()
+        return (left, top, right - left, bottom - top)
+
+    # Gets the objects in a spatial index visible to each camera, with one index query for the whole group
+    # Returns a dictionary of each camera to the keys it can see
+    def query_visible(self, index):
+        keys = index.query_rect(self.get_union_rect())
+        rects = [index.get_rect(key) for key in keys]
+        return {cam: [key for key, rect in zip(keys, rects) if cam.rect_in_bounds(rect)] for cam in self.cameras}
+
+    # Draws a batch of rectangles to every camera
+    def draw_rects(self, rects, colour):
+        if not self.cameras:
+            return
+        left, top, right, bottom = self.get_union_bounds()
+        if np is not None:
+            r = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+            visible = np.flatnonzero((r[:, 0] <= right) & (r[:, 0] + r[:, 2] >= left) & (r[:, 1] + r[:, 3] >= top) & (r[:, 1] <= bottom))
+            r = r[visible]
+        else:
+            visible = [i for i, rect in enumerate(rects) if rect[0] <= right and rect[0] + rect[2] >= left and rect[1] + rect[3] >= top and rect[1] <= bottom]
+            r = [rects[i] for i in visible]
+        colour = CameraGroup._visible_colours(colour, visible)
+        for cam in self.cameras:
+            cam.draw_rects(r, colour)
+
+    # Draws a batch of circles to every camera
+    def draw_circles(self, centres, radius, colour):
+        if not self.cameras:
+            return
+        left, top, right, bottom = self.get_union_bounds()
+        if np is not None:
+            c = np.asarray(centres, dtype=np.float64).reshape(-1, 2)
+            r = np.broadcast_to(np.asarray(radius, dtype=np.float64), (len(c),))
+            visible = np.flatnonzero((c[:, 0] - r <= right) & (c[:, 0] + r >= left) & (c[:, 1] + r >= top) & (c[:, 1] - r <= bottom))
+            c = c[visible]
+            r = r[visible]
+        else:
+            radii = radius if isinstance(radius, (list, tuple)) else [radius] * len(centres)
+            visible = [i for i, (centre, r) in enumerate(zip(centres, radii)) if centre[0] - r <= right and centre[0] + r >= left and centre[1] + r >= top and centre[1] - r <= bottom]
+            c = [centres[i] for i in visible]
+            r = [radii[i] for i in visible]
+        colour = CameraGroup._visible_colours(colour, visible)
+        for cam in self.cameras:
+            cam.draw_circles(c, r, colour)
+
+    # Draws a batch of lines to every camera
+    def draw_lines(self, starts, ends, colour, width = 1):
+        if not self.cameras:
+            return
+        left, top, right, bottom = self.get_union_bounds()
+        if np is not None:
+            s = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+            e = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+            low = np.minimum(s, e)
+            high = np.maximum(s, e)
+            visible = np.flatnonzero((low[:, 0] <= right) & (high[:, 0] >= left) & (high[:, 1] >= top) & (low[:, 1] <= bottom))
+            s = s[visible]
+            e = e[visible]
+        else:
+            visible = [i for i, (start, end) in enumerate(zip(starts, ends)) if min(start[0], end[0]) <= right and max(start[0], end[0]) >= left and max(start[1], end[1]) >= top and min(start[1], end[1]) <= bottom]
+            s = [starts[i] for i in visible]
+            e = [ends[i] for i in visible]
+        colour = CameraGroup._visible_colours(colour, visible)
+        for cam in self.cameras:
+            cam.draw_lines(s, e, colour, width)
+
+    # Gets the colour argument for the visible items of a batch, keeping a single colour as it is
+    @staticmethod
+    def _visible_colours(colour, visible):
+        if Camera._single_colour(colour):
+            return colour
+        return [colour[i] for i in visible]
+
+# Python SurfaceCache object
+# A memory bounded least-recently-used cache of scaled copies of surfaces, or of parts of surfaces, keyed by surface, part and scaled size
+# Scales are quantised to a number of levels per doubling, so small changes in zoom reuse the same scaled surface
+# With mipmaps enabled, downscaled surfaces are smoothly scaled from the nearest halved copy of the source
+# Dependencies : math, pygame, collections
+class SurfaceCache:
+    def __init__(self, maxBytes=64 * 1024 * 1024, levelsPerDoubling=16, mipmaps=False, smooth=False):
+        self.maxBytes = maxBytes                    # Memory budget for cached surfaces in bytes, which no single surface may exceed
+        self.levelsPerDoubling = levelsPerDoubling  # Number of quantised scale levels between each power of two
+        self.mipmaps = mipmaps                      # Whether to build halved copies of sources to downscale from
+        self.smooth = smooth                        # Whether to use smoothscale rather than scale
+        self.entries = OrderedDict()                # Maps (surface, size[, rect]) to cached surfaces, least recently used first
+        self.bytes = 0                              # Memory currently used by cached surfaces
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Quantises a scale to its nearest level, returning the level and the scale it represents
+    def quantise(self, scale):
+        level = round(math.log2(scale) * self.levelsPerDoubling)
+        return level, 2 ** (level / self.levelsPerDoubling)
+
+    # Gets a surface, or the part of it in a rect, scaled to a given size in pixels
+    def get(self, surface, size, rect = None):
+        size = (size[0], size[1])
+        if rect is None:
+            key = (surface, size)
+            source = surface
+        else:
+            rect = tuple(rect)
+            key = (surface, size, rect)
+            source = surface.subsurface(rect)
+        if size == source.get_size():
+            return source
+        scaled = self.entries.get(key)
+        if scaled is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return scaled
+        self.misses += 1
+        scale = min(size[0] / source.get_width(), size[1] / source.get_height())
+        if self.mipmaps and scale < 1:
+            # The mip level only picks the source to scale from, the output is always the size asked for
+            mip = self._mipmap(surface, min(int(-math.log2(scale)), 16))
+            if rect is None:
+                source = mip
+            else:
+                scaleX = mip.get_width() / surface.get_width()
+                scaleY = mip.get_height() / surface.get_height()
+                left, top = int(rect[0] * scaleX), int(rect[1] * scaleY)
+                right = min(mip.get_width(), max(left + 1, math.ceil((rect[0] + rect[2]) * scaleX)))
+                bottom = min(mip.get_height(), max(top + 1, math.ceil((rect[1] + rect[3]) * scaleY)))
+                source = mip.subsurface((left, top, right - left, bottom - top))
+        scaled = pygame.transform.smoothscale(source, size) if self.smooth or self.mipmaps else pygame.transform.scale(source, size)
+        self._store(key, scaled)
+        return scaled
+
+    # Removes every cached copy of a surface, which should be done after the surface is drawn on
+    def invalidate(self, surface):
+        for key in [key for key in self.entries if key[0] is surface]:
+            self.bytes -= SurfaceCache._size(self.entries.pop(key))
+
+    # Removes every cached surface
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    # Gets a copy of a surface halved in size a given number of times, building and caching the levels as needed
+    def _mipmap(self, surface, depth):
+        if depth == 0:
+            return surface
+        key = (surface, ("mip", depth))
+        mip = self.entries.get(key)
+        if mip is not None:
+            self.entries.move_to_end(key)
+            return mip
+        parent = self._mipmap(surface, depth - 1)
+        mip = pygame.transform.smoothscale(parent, (max(1, parent.get_width() // 2), max(1, parent.get_height() // 2)))
+        self._store(key, mip)
+        return mip
+
+    # Adds a surface to the cache, evicting the least recently used surfaces while over the memory budget
+    # Surfaces larger than the whole budget are not stored
+    def _store(self, key, scaled):
+        size = SurfaceCache._size(scaled)
+        if size > self.maxBytes:
+            return
+        self.entries[key] = scaled
+        self.bytes += size
+        while self.bytes > self.maxBytes and self.entries:
+            oldKey, old = self.entries.popitem(last=False)
+            self.bytes -= SurfaceCache._size(old)
+
+    # Gets the memory used by a surface in bytes
+    @staticmethod
+    def _size(surface):
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+# Python RenderQueue object
+# Records screen space draw commands with a layer, and issues them sorted by layer, then in the order they were recorded
+# Within a layer, a command is only moved back to join an earlier command of the same kind and colour or surface when it
+# doesn't overlap anything recorded in between, so grouping never changes which command ends up on top
+# The recorded commands can be replayed onto any surface, such as an off-screen one, to measure render cost
+# Dependencies : time, pygame
+class RenderQueue:
+
+    KINDS = ("blit", "polygon", "rect", "circle", "line")
+    FUNCTIONS = {
+        "blit": lambda win, source, dest, area: win.blit(source, dest, area=area),
+        "polygon": pygame.draw.polygon,
+        "rect": pygame.draw.rect,
+        "circle": pygame.draw.circle,
+        "line": pygame.draw.line,
+    }
+
+    def __init__(self):
+        self.commands = []      # Recorded commands as (layer, kind index, group, sequence, kind, args)
+        self.sorted = True      # Whether the commands are already in issue order
+
+    def __len__(self):
+        return len(self.commands)
+
+    # Records a draw command, where args are the arguments to the pygame call after the target surface
+    def add(self, layer, kind, args):
+        if kind == "blit":
+            group = id(args[0])
+        else:
+            group = hash(args[0] if isinstance(args[0], str) else tuple(args[0]))
+        self.commands.append((layer, RenderQueue.KINDS.index(kind), group, len(self.commands), kind, args))
+        self.sorted = False
+
+    # Sorts the commands into issue order
+    def sort(self):
+        if self.sorted:
+            return
+        self.commands.sort(key=lambda command: command[0])
+        ordered = []
+        start = 0
+        while start < len(self.commands):
+            end = start
+            while end < len(self.commands) and self.commands[end][0] == self.commands[start][0]:
+                end += 1
+            ordered.extend(RenderQueue._group(self.commands[start:end]))
+            start = end
+        self.commands = ordered
+        self.sorted = True
+
+    # Groups the commands of one layer into batches of the same kind and colour or surface
+    # A command joins the latest batch with its key only if it doesn't overlap any batch after that one, otherwise it starts a new batch
+    @staticmethod
+    def _group(commands):
+        batches = []        # Batches as [bounds, commands], where bounds is None if they are unknown
+        latest = {}         # Maps (kind index, group) to the index of the latest batch with that key
+        for command in commands:
+            key = command[1:3]
+            bounds = RenderQueue._bounds(command[4], command[5])
+            index = latest.get(key)
+            if index == len(batches) - 1:
+                batch = batches[index]
+                batch[0] = None if batch[0] is None or bounds is None else batch[0].union(bounds)
+                batch[1].append(command)
+            elif index is not None and bounds is not None and batches[index][0] is not None and \
+                    all(batch[0] is not None and not bounds.colliderect(batch[0]) for batch in batches[index + 1:]):
+                batch = batches[index]
+                batch[0] = batch[0].union(bounds)
+                batch[1].append(command)
+            else:
+                latest[key] = len(batches)
+                batches.append([bounds, [command]])
+        return [command for batch in batches for command in batch[1]]
+
+    # Gets the screen rect that a command may draw to, or None if it can't be worked out
+    @staticmethod
+    def _bounds(kind, args):
+        try:
+            if kind == "blit":
+                source, dest, area = args
+                size = source.get_size() if area is None else pygame.Rect(area).size
+                return pygame.Rect(math.floor(dest[0]), math.floor(dest[1]), size[0] + 1, size[1] + 1)
+            if kind == "rect":
+                return pygame.Rect(args[1]).inflate(2, 2)
+            if kind == "circle":
+                centre, radius = args[1], args[2]
+                return pygame.Rect(math.floor(centre[0] - radius) - 1, math.floor(centre[1] - radius) - 1, math.ceil(2 * radius) + 3, math.ceil(2 * radius) + 3)
+            if kind == "line":
+                points = (args[1], args[2])
+                width = args[3] if len(args) > 3 else 1
+            else:
+                points = args[1]
+                width = 1
+            xs = [point[0] for point in points]
+            ys = [point[1] for point in points]
+            left, top = math.floor(min(xs)) - width, math.floor(min(ys)) - width
+            return pygame.Rect(left, top, math.ceil(max(xs)) + width - left + 1, math.ceil(max(ys)) + width - top + 1)
+        except (TypeError, ValueError, IndexError):
+            return None
+
+    # Issues every command onto a target surface and clears the queue
+    def flush(self, target):
+        self.replay(target)
+        self.clear()
+
+    # Issues every command onto a target surface without clearing the queue
+    # If timed, returns a dictionary of each kind of command to its count and total time in seconds
+    def replay(self, target, timed = False):
+        self.sort()
+        if not timed:
+            for command in self.commands:
+                RenderQueue.FUNCTIONS[command[4]](target, *command[5])
+            return None
+        results = {}
+        for command in self.commands:
+            start = time.perf_counter()
+            RenderQueue.FUNCTIONS[command[4]](target, *command[5])
+            count, total = results.get(command[4], (0, 0))
+            results[command[4]] = (count + 1, total + time.perf_counter() - start)
+        return results
+
+    # Gets the number of recorded commands of each kind
+    def stats(self):
+        counts = {}
+        for command in self.commands:
+            counts[command[4]] = counts.get(command[4], 0) + 1
+        return counts
+
+    # Removes every recorded command
+    def clear(self):
+        self.commands = []
+        self.sorted = True
@@ -1,25 +1,129 @@
+import math
 import time
 import pygame
 import win32clipboard
+from collections import OrderedDict
+from personallib.maths import SpatialHash
+
+# Gets the integer rectangle covering a surface blitted at a float position, as pygame truncates blit positions
+def _bounds(x, y, width, height):
+    return pygame.Rect(math.floor(x), math.floor(y), width + 1, height + 1)
 
 # Python Canvas object
 # A collection of UI elements that can be drawn to the screen in conjunction with the 2D camera controller
-# Dependencies : pygame, personallib.camera
+# In dirty rect mode only the areas of elements that have changed since the last frame are redrawn and blitted,
+# and update returns those areas for pygame.display.update
+# Mouse and key events can be routed with dispatch, which finds the elements under the cursor with a spatial hash
+# Dependencies : math, pygame, personallib.camera, personallib.maths
 class Canvas:
-    def __init__(self, width, height):
+    def __init__(self, width, height, dirtyRects=False, cellSize=64):
         self.elements = []
+        self.labels = {}                # Maps labels to elements, the first added taking precedence
+        self.types = {}                 # Maps element classes to the elements of that class in drawing order
         self.width = width
         self.height = height
         self.visible = True
         self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
-
-    def update(self, cam):
+        self.dirtyRects = dirtyRects    # Whether to only redraw the areas that have changed
+        self.snapshots = {}             # Maps elements to their state and bounds when last drawn
+        self.drawn = False              # Whether the canvas is currently shown on the screen in dirty rect mode
+        self.background = None          # Background colour and surface used to restore the screen under dirty rects
+        self.index = SpatialHash(cellSize)  # Bounds of the elements that can be hovered and clicked
+        self.order = {}                 # Maps elements to the order they were added, to find the topmost element
+        self.count = 0                  # Number of elements added, used to order them
+        self.hovered = set()            # Elements under the cursor when the mouse last moved
+        self.pressed = None             # Element clicked while the left mouse button is held
+        self.focused = None             # Active text box that receives key events
+        self.mouse = (0, 0)             # Cursor position from the last mouse event
+
+    # Draws the canvas to the screen and returns the screen areas that were drawn
+    # In dirty rect mode the screen under each area is first restored from the background colour or surface if given,
+    # otherwise the caller must restore it before updating
+    def update(self, cam, background=None):
+        if self.dirtyRects:
+            return self._update_dirty(cam, background)
         if not self.visible:
-            return
+            return []
         self.surface.fill((0, 0, 0, 0))
         for element in self.elements:
             element.draw(self.surface)
         cam.blit(self.surface, cam.get_world_coord((0, 0)))
+        return [self.surface.get_rect()]
+
+    # Gets the areas of the canvas that have changed since the last frame and records the current element states
+    # Elements without change tracking, or whose state is None, are redrawn every frame
+    def get_dirty_rects(self):
+        full = self.surface.get_rect()
+        if not self.visible:
+            self.snapshots = {}
+            if self.drawn:
+                self.drawn = False
+                return [full]
+            return []
+        rects = [] if self.drawn else [full]
+        self.drawn = True
+        snapshots = {}
+        for element in self.elements:
+            state = element.get_state() if hasattr(element, "get_state") else None
+            rect = element.get_rect() if hasattr(element, "get_rect") else None
+            snapshot = self.snapshots.pop(element, None)
+            snapshots[element] = (state, rect)
+            if state is None or snapshot != (state, rect):
+                if snapshot is not None:
+                    rects.append(snapshot[1])
+                rects.append(rect)
+        for state, rect in self.snapshots.values():
+            rects.append(rect)
+        self.snapshots = snapshots
+        if None in rects:
+            return [full]
+        merged = []
+        for rect in rects:
+            rect = rect.clip(full)
+            if rect.width == 0 or rect.height == 0:
+                continue
+            index = rect.collidelist(merged)
+            while index != -1:
+                rect = rect.union(merged.pop(index))
+                index = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+
+    # Forces an element, or the whole canvas, to be redrawn, such as after a surface is changed in place
+    def mark_dirty(self, element=None):
+        if element is None:
+            self.drawn = False
+        elif element in self.snapshots:
+            self.snapshots[element] = (None, self.snapshots[element][1])
+
+    def _update_dirty(self, cam, background):
+        rects = self.get_dirty_rects()
+        if not rects:
+            return rects
+        if background is not None:
+            if isinstance(background, pygame.Surface):
+                source = background
+            else:
+                if self.background is None or self.background[0] != background:
+                    surface = pygame.Surface((self.width, self.height))
+                    surface.fill(background)
+                    self.background = (background, surface)
+                source = self.background[1]
+            for rect in rects:
+                cam.blit_screen(source, rect.topleft, rect)
+        if not self.visible:
+            return rects
+        for rect in rects:
+            self.surface.set_clip(rect)
+            self.surface.fill((0, 0, 0, 0))
+            for element in self.elements:
+                bounds = self.snapshots[element][1]
+                if bounds is None or bounds.colliderect(rect):
+                    element.draw(self.surface)
+        self.surface.set_clip(None)
+        for rect in rects:
+            cam.blit_screen(self.surface, rect.topleft, rect)
+        return rects
 
     def set_visible(self, state):
         self.visible = state
@@ -29,19 +133,142 @@ class Canvas:
 
     def add_element(self, element):
         self.elements.append(element)
+        self.labels.setdefault(element.label, element)
+        self.types.setdefault(element.__class__, []).append(element)
+        self.order[element] = self.count
+        self.count += 1
+        if hasattr(element, "hover") and hasattr(element, "click"):
+            self.index.insert_rect(element, (element.x, element.y, element.width, element.height))
+
+    def remove_element(self, element):
+        if element not in self.types.get(element.__class__, []):
+            raise Exception(f"Element '{element.label}' not found")
+        self.elements.remove(element)
+        elements = self.types[element.__class__]
+        elements.remove(element)
+        if not elements:
+            del self.types[element.__class__]
+        if self.labels.get(element.label) is element:
+            del self.labels[element.label]
+            for e in self.elements:
+                if e.label == element.label:
+                    self.labels[e.label] = e
+                    break
+        del self.order[element]
+        if element in self.index:
+            self.index.remove(element)
+        self.hovered.discard(element)
+        if self.pressed is element:
+            self.pressed = None
+        if self.focused is element:
+            self.focused = None
+
+    # Moves an element so that its top left corner is at pos, keeping its hit testing bounds up to date
+    def move_element(self, element, pos):
+        element.x = pos[0]
+        element.y = pos[1]
+        if element in self.index:
+            self.index.move(element, pos)
+
+    # Updates the hit testing bounds of an element after its position or size has been changed directly
+    def refresh_element(self, element):
+        if element in self.index:
+            self.index.insert_rect(element, (element.x, element.y, element.width, element.height))
+
+    # Gets the visible and enabled interactive elements under a point in drawing order, so the topmost element is last
+    def get_elements_at(self, pos):
+        return sorted(self._query(pos), key=self.order.get)
+
+    # Routes a pygame event to the elements it affects and returns whether any element received it
+    # Mouse movement only reaches the elements the cursor enters or leaves, clicks go to the topmost element
+    # under the cursor and key presses go to the focused text box
+    def dispatch(self, event):
+        if not self.visible:
+            return False
+        if event.type == pygame.MOUSEMOTION:
+            self.mouse = event.pos
+            return self._hover(event.pos)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.mouse = event.pos
+            hits = self.get_elements_at(event.pos)
+            target = hits[-1] if hits else None
+            focused = self.focused
+            if focused is not None and focused is not target:
+                focused.active = False
+                focused.drawingColour = focused.colour
+                self.focused = None
+                if focused in self.hovered:
+                    focused.hover(event.pos)
+            if target is None:
+                return focused is not None
+            target.click(event.pos)
+            if getattr(target, "active", False):
+                self.focused = target
+            else:
+                self.pressed = target
+            return True
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.mouse = event.pos
+            pressed = self.pressed
+            if pressed is None:
+                return False
+            self.pressed = None
+            pressed.hover(event.pos)
+            return True
+        elif event.type == pygame.KEYDOWN:
+            focused = self.focused
+            if focused is None:
+                return False
+            focused.input_key_event(event)
+            if not focused.active:
+                self.focused = None
+                if focused in self.hovered:
+                    focused.hover(self.mouse)
+            return True
+        return False
+
+    # Blinks the cursor of the focused text box
+    def update_cursor(self):
+        if self.focused is not None:
+            self.focused.update_cursor()
+
+    # Gets the visible and enabled interactive elements under a point, with hidden and disabled elements left
+    # in the index so that they are found again as soon as they are shown or enabled
+    def _query(self, pos):
+        return [element for element in self.index.query_rect((pos[0], pos[1], 0, 0))
+                if getattr(element, "visible", True) and getattr(element, "enabled", True)]
+
+    # Sends hover updates to the elements the cursor has entered or left, and to the last clicked element
+    def _hover(self, pos):
+        hits = set(self._query(pos))
+        changed = hits.symmetric_difference(self.hovered)
+        self.hovered = hits
+        if self.pressed is not None:
+            # Moving after a click returns the clicked element to its hover or default state
+            changed.add(self.pressed)
+            self.pressed = None
+        for element in changed:
+            element.hover(pos)
+        return bool(changed)
 
     def find_element(self, label):
-        for e in self.elements:
-            if e.label == label:
-                return e
-        raise Exception(f"Element '{label}' not found")
+        if label not in self.labels:
+            raise Exception(f"Element '{label}' not found")
+        return self.labels[label]
+
+    # Gets the elements that are instances of a class, including its subclasses
+    def get_elements_of_type(self, type):
+        elements = []
+        for cls, registered in self.types.items():
+            if issubclass(cls, type):
+                elements.extend(registered)
+        return elements
 
     def run_method_on_type(self, type, method, params=[]):
         if not self.visible:
             return
-        for element in self.elements:
-            if isinstance(element, type):
-                getattr(element, method)(*params)
+        for element in self.get_elements_of_type(type):
+            getattr(element, method)(*params)
 
 # Python Fill object
 # A UI element that fills the screen with a given colour and can fade in and out
@@ -72,6 +299,16 @@ class Fill:
                     self.fade[4] += timeChange - self.fade[3]
         surface.fill((self.colour[0], self.colour[1], self.colour[2], self.opacity * 255))
 
+    # Gets the area drawn to, where None is the whole canvas
+    def get_rect(self):
+        return None
+
+    # Gets the state that affects drawing, or None while fading so that it is redrawn every frame
+    def get_state(self):
+        if self.fade[0]:
+            return None
+        return (self.visible, self.colour, self.opacity)
+
     def set_visible(self, state):
         if self.fade[0]:
             self.opacity = self.fade[1]
@@ -91,12 +328,62 @@ class Fill:
         increment = (opacity - self.opacity) / (duration / update)
         self.fade = [True, opacity, increment, update, time.time()]
 
+# Python TextCache object
+# A cache of fonts keyed by name and size, and a memory bounded least-recently-used cache of rendered text
+# keyed by font, text, colour and antialiasing
+# Rendered surfaces are shared by every Text showing the same string, so they must not be drawn on
+# Dependencies : pygame, collections
+class TextCache:
+    def __init__(self, maxBytes=16 * 1024 * 1024):
+        self.maxBytes = maxBytes        # Memory budget for rendered text in bytes
+        self.fonts = {}                 # Maps (name, size) to loaded fonts
+        self.entries = OrderedDict()    # Maps (font, text, colour, antialiasing) to rendered surfaces, least recently used first
+        self.bytes = 0                  # Memory currently used by rendered text
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Gets a system font, only loading it the first time it is used at a size
+    def get_font(self, name, size):
+        key = (name, size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = pygame.font.SysFont(name, size)
+            self.fonts[key] = font
+        return font
+
+    # Gets a string rendered in a font, only rendering it if it isn't already cached
+    def render(self, font, text, colour, antialiasing=True):
+        key = (font, text, tuple(colour), antialiasing)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = font.render(text, antialiasing, colour)
+        self.entries[key] = surface
+        self.bytes += surface.get_width() * surface.get_height() * surface.get_bytesize()
+        while self.bytes > self.maxBytes and len(self.entries) > 1:
+            oldKey, old = self.entries.popitem(last=False)
+            self.bytes -= old.get_width() * old.get_height() * old.get_bytesize()
+        return surface
+
+    # Removes every rendered surface, keeping the loaded fonts
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
 # Python Text object
 # A UI element that displays text on the screen
+# Fonts and rendered text are shared between every Text through a process wide TextCache
 # Dependencies : pygame
 class Text:
 
     pygame.font.init()
+    cache = TextCache()
 
     def __init__(self, label, pos, font, size, text="", colour=(0,0,0), align="left", antialiasing=True):
         self.label = label
@@ -104,7 +391,7 @@ class Text:
         self.y = pos[1]
         self.fontName = font
         self.size = size
-        self.font = pygame.font.SysFont(font, size)
+        self.font = Text.cache.get_font(font, size)
         self.colour = colour
         self.visible = True
         self.align = align if align in ["left", "centre", "right"] else "left"
@@ -115,11 +402,15 @@ class Text:
             colour = self.colour
         else:
             self.colour = colour
-        self.text = self.font.render(text, antialiasing, colour)
+        self.text = Text.cache.render(self.font, text, colour, antialiasing)
 
     def draw(self, surface):
         if not self.visible:
             return
+        surface.blit(self.text, self.get_position())
+
+    # Gets the top left position of the rendered text after alignment
+    def get_position(self):
         if self.align == "left":
             x = self.x
         elif self.align == "centre":
@@ -127,7 +418,14 @@ class Text:
         elif self.align == "right":
             x = self.x - self.text.get_width()
         y = self.y - (self.text.get_height() / 2)
-        surface.blit(self.text, (x, y))
+        return (x, y)
+
+    def get_rect(self):
+        x, y = self.get_position()
+        return _bounds(x, y, self.text.get_width(), self.text.get_height())
+
+    def get_state(self):
+        return (self.visible, self.text)
 
     def set_visible(self, state):
         self.visible = state
@@ -156,6 +454,12 @@ class Image:
             return
         surface.blit(self.image, (self.x, self.y))
 
+    def get_rect(self):
+        return _bounds(self.x, self.y, self.image.get_width(), self.image.get_height())
+
+    def get_state(self):
+        return (self.visible, self.image)
+
     def set_path(self, path):
         try:
             self.image = pygame.image.load(path)
@@ -209,6 +513,20 @@ class Button:
                 self.y + (self.height / 2) - (self.text.text.get_height() / 2) + self.text.y
             ))
 
+    def get_rect(self):
+        if self.animated:
+            return _bounds(self.x, self.y, self.image.get_width(), self.image.get_height())
+        return _bounds(self.x, self.y, self.width, self.height).union(_bounds(
+            self.x + (self.width / 2) - (self.text.text.get_width() / 2) + self.text.x,
+            self.y + (self.height / 2) - (self.text.text.get_height() / 2) + self.text.y,
+            self.text.text.get_width(), self.text.text.get_height()
+        ))
+
+    def get_state(self):
+        if self.animated:
+            return (self.visible, self.image)
+        return (self.visible, self.drawingColour, self.text.text)
+
     def set_visible(self, state):
         if self.animated:
             self.image = self.animation["default"]
@@ -292,8 +610,11 @@ class TextBox:
         self.width = dimensions[0]
         self.height = dimensions[1]
         self.text = text
-        self.frontText = None
-        self.endText = None
+        self.rendered = None        # Surface of the whole text, or of the placeholder when empty
+        self.layout = None          # Font, string, colour and whether it is the placeholder of the rendered surface
+        self.widths = {}            # Maps cursor positions to the width of the text before them in the rendered layout
+        self.cursorX = 0            # Offset of the cursor from the start of the text
+        self.composed = None        # State that the contents surface was last composed with
         self.textContents = textContents
         self.textColour = textColour
         self.placeholderText = placeholderText
@@ -318,24 +639,30 @@ class TextBox:
         self.update_text()
     
     def draw(self, surface):
-        self.contents.fill((0, 0, 0, 0))
         if self.border:
             pygame.draw.rect(surface, self.borderColour, (self.x, self.y, self.width, self.height))
+        composed = (self.rendered, self.cursorX, self.drawingColour, self.textColour, self.active and self.cursorVisible)
+        if composed != self.composed:
+            self.compose()
+            self.composed = composed
+        surface.blit(self.contents, (self.x + self.borderWidth, self.y + self.borderWidth))
+
+    # Draws the background, text and cursor onto the contents surface, which is kept until one of them changes
+    def compose(self):
+        height = self.rendered.get_height()
         self.contents.fill(self.drawingColour)
-        self.contents.blit(self.frontText, (
-            (self.frontText.get_height() / 4), (self.height / 2) - (self.frontText.get_height() / 2) - self.borderWidth
-        ))
-        self.contents.blit(self.endText, (
-            (self.frontText.get_height() / 4) + self.frontText.get_width(),
-            (self.height / 2) - (self.endText.get_height() / 2) - self.borderWidth
-        ))
+        self.contents.blit(self.rendered, ((height / 4), (self.height / 2) - (height / 2) - self.borderWidth))
         if self.active and self.cursorVisible:
             pygame.draw.rect(self.contents, self.textColour, (
-                (self.frontText.get_height() / 4) + self.frontText.get_width(),
-                (self.height / 2) - (self.frontText.get_height() / 2) - self.borderWidth, 2, self.frontText.get_height()
+                (height / 4) + self.cursorX, (self.height / 2) - (height / 2) - self.borderWidth, 2, height
             ))
-        surface.blit(self.contents, (self.x + self.borderWidth, self.y + self.borderWidth))
-        
+
+    def get_rect(self):
+        return _bounds(self.x, self.y, self.width, self.height)
+
+    def get_state(self):
+        return (self.visible, self.drawingColour, self.rendered, self.cursorX, self.active and self.cursorVisible)
+
     def set_visible(self, state):
         self.active = False
         self.drawingColour = self.colour
@@ -363,18 +690,26 @@ class TextBox:
         self.cursorPos = len(text)
         self.update_text()
 
+    # Lays out the text after it or the cursor has changed, only rendering it again if the text has changed
+    # Cursor offsets are measured without rendering and kept until the text changes
     def update_text(self):
-        usePlaceholder = self.placeholder and self.textContents == ""
-        if usePlaceholder:
-            self.text.render(self.textContents[:self.cursorPos], self.textColour)
-            self.frontText = self.text.text
-            self.text.render(self.placeholderText, self.placeholderColour)
-            self.endText = self.text.text
+        if self.placeholder and self.textContents == "":
+            layout = (self.text.font, self.placeholderText, self.placeholderColour, True)
         else:
-            self.text.render(self.textContents[:self.cursorPos], self.textColour)
-            self.frontText = self.text.text
-            self.text.render(self.textContents[self.cursorPos:], self.textColour)
-            self.endText = self.text.text
+            layout = (self.text.font, self.textContents, self.textColour, False)
+        if layout != self.layout:
+            self.text.render(layout[1], layout[2])
+            self.rendered = self.text.text
+            self.layout = layout
+            self.widths = {}
+        if layout[3]:
+            self.cursorX = 0
+            return
+        width = self.widths.get(self.cursorPos)
+        if width is None:
+            width = self.text.font.size(self.textContents[:self.cursorPos])[0]
+            self.widths[self.cursorPos] = width
+        self.cursorX = width
 
     def enable_cursor(self):
         self.cursorVisible = True
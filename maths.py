@@ -1,121 +1,1153 @@
 import math
+import mmap
+import operator
 import random
+import struct
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Linear interpolation for two values
+# Any of the arguments may be arrays, in which case the whole array is interpolated in one pass
 def lerp(a: float, b: float, w: float) -> float:
+    if _is_array(a) or _is_array(b) or _is_array(w):
+        if np is not None:
+            a = np.asarray(a, dtype=np.float64)
+            b = np.asarray(b, dtype=np.float64)
+            w = np.asarray(w, dtype=np.float64)
+            return b + w * (a - b)
+        return [bi + wi * (ai - bi) for ai, bi, wi in zip(_iterate(a), _iterate(b), _iterate(w))]
     return b + w * (a - b)
 
 # Sigmoid function
-def sigmoid(x: float) -> float:
-    return 1 / (1 + (math.e ** (-x)))
+# Evaluated in a numerically stable form that doesn't overflow for large negative values
+# Accepts arrays, and can be evaluated with a SigmoidTable when exactness isn't needed
+def sigmoid(x: float, table=None) -> float:
+    if table is not None:
+        return table(x)
+    if _is_array(x):
+        if np is None:
+            return [sigmoid(item) for item in x]
+        x = np.asarray(x, dtype=np.float64)
+        z = np.exp(-np.abs(x))
+        return np.where(x >= 0, 1 / (1 + z), z / (1 + z))
+    if x >= 0:
+        return 1 / (1 + math.exp(-x))
+    z = math.exp(x)
+    return z / (1 + z)
+
+# Checks whether a value should be treated as an array of values rather than a scalar
+def _is_array(value):
+    return isinstance(value, (list, tuple, array)) or (np is not None and isinstance(value, np.ndarray))
+
+# Checks whether a number has an integer value
+def _is_integral(value):
+    return isinstance(value, int) or float(value).is_integer()
+
+# Iterates over an array, or repeats a scalar
+def _iterate(value):
+    return value if _is_array(value) else repeat(value)
+
+# Python SigmoidTable object
+# A precomputed table of sigmoid values over [-limit, limit], evaluated by linear interpolation
+# maxError bounds the absolute error from both the interpolation and clamping values outside the table's range
+# Dependencies : math (optional: numpy)
+class SigmoidTable:
+
+    MAX_SECOND_DERIVATIVE = 1 / (6 * math.sqrt(3))     # The largest magnitude of the sigmoid's second derivative
+
+    def __init__(self, size=4096, limit=16.0):
+        self.size = size                                    # Number of values in the table
+        self.limit = limit                                  # Inputs are clamped to [-limit, limit]
+        self.step = 2 * limit / (size - 1)                  # Distance between table entries
+        values = [sigmoid(-limit + i * self.step) for i in range(size)]
+        self.table = np.array(values) if np is not None else array('d', values)
+        self.maxError = max(self.step ** 2 / 8 * SigmoidTable.MAX_SECOND_DERIVATIVE, sigmoid(-limit))
+
+    # Evaluates the sigmoid of a value or array of values from the table
+    def __call__(self, x):
+        if _is_array(x):
+            if np is None:
+                return [self(item) for item in x]
+            t = (np.clip(np.asarray(x, dtype=np.float64), -self.limit, self.limit) + self.limit) / self.step
+            i = np.minimum(t.astype(np.intp), self.size - 2)
+            f = t - i
+            return self.table[i] + f * (self.table[i + 1] - self.table[i])
+        t = (min(max(x, -self.limit), self.limit) + self.limit) / self.step
+        i = min(int(t), self.size - 2)
+        low = self.table[i]
+        return low + (t - i) * (self.table[i + 1] - low)
+
+# Region codes for Cohen-Sutherland line clipping
+_INSIDE, _LEFT, _RIGHT, _TOP, _BOTTOM = 0, 1, 2, 4, 8
+
+# Gets the Cohen-Sutherland region code of a point relative to the rectangle edges
+def _region_code(x, y, left, top, right, bottom):
+    code = _INSIDE
+    if x < left:
+        code |= _LEFT
+    elif x > right:
+        code |= _RIGHT
+    if y < top:
+        code |= _TOP
+    elif y > bottom:
+        code |= _BOTTOM
+    return code
+
+# Clips the line between two points to a rectangle (x, y, width, height) with the Cohen-Sutherland algorithm
+# Returns the clipped start and end points, or None if the line is entirely outside the rectangle
+def clip_line(start, end, rect):
+    left, top = rect[0], rect[1]
+    right, bottom = rect[0] + rect[2], rect[1] + rect[3]
+    x1, y1 = start[0], start[1]
+    x2, y2 = end[0], end[1]
+    code1 = _region_code(x1, y1, left, top, right, bottom)
+    code2 = _region_code(x2, y2, left, top, right, bottom)
+    while True:
+        if not (code1 | code2):
+            return (x1, y1), (x2, y2)
+        if code1 & code2:
+            return None
+        code = code1 or code2
+        if code & _BOTTOM:
+            x = x1 + (x2 - x1) * (bottom - y1) / (y2 - y1)
+            y = bottom
+        elif code & _TOP:
+            x = x1 + (x2 - x1) * (top - y1) / (y2 - y1)
+            y = top
+        elif code & _RIGHT:
+            y = y1 + (y2 - y1) * (right - x1) / (x2 - x1)
+            x = right
+        else:
+            y = y1 + (y2 - y1) * (left - x1) / (x2 - x1)
+            x = left
+        if code == code1:
+            x1, y1 = x, y
+            code1 = _region_code(x1, y1, left, top, right, bottom)
+        else:
+            x2, y2 = x, y
+            code2 = _region_code(x2, y2, left, top, right, bottom)
+
+# Clips a polygon to a rectangle (x, y, width, height) with the Sutherland-Hodgman algorithm
+# Returns the clipped polygon's points, which is empty if the polygon is entirely outside the rectangle
+def clip_polygon(points, rect):
+    left, top = rect[0], rect[1]
+    right, bottom = rect[0] + rect[2], rect[1] + rect[3]
+    # Each edge is (axis, boundary, keep points on the side greater than the boundary)
+    for axis, boundary, greater in ((0, left, True), (0, right, False), (1, top, True), (1, bottom, False)):
+        if not points:
+            break
+        clipped = []
+        previous = points[-1]
+        previousInside = (previous[axis] >= boundary) if greater else (previous[axis] <= boundary)
+        for point in points:
+            inside = (point[axis] >= boundary) if greater else (point[axis] <= boundary)
+            if inside != previousInside:
+                t = (boundary - previous[axis]) / (point[axis] - previous[axis])
+                crossing = [previous[0] + t * (point[0] - previous[0]), previous[1] + t * (point[1] - previous[1])]
+                crossing[axis] = boundary
+                clipped.append(tuple(crossing))
+            if inside:
+                clipped.append((point[0], point[1]))
+            previous = point
+            previousInside = inside
+        points = clipped
+    return list(points)
 
 # Python Matrix object
-# Stores matrices as 2D lists and has static methods to use on matrices
-# Dependencies : None
+# Stores matrices as 2D lists, or as contiguous ndarrays when NumPy is available, and has static methods to use on matrices
+# Dependencies : None (optional: numpy)
 class Matrix:
-    def __init__(self, r: int, c: int) -> None:
-        self.matrix = []            # Matrix stored as a 2D list
-        self.columns = []           # A list of the columns in the matrix
-        for i in range(r):          # Default matrix setup
-            row = []
-            for j in range(c):
-                row.append(random.randint(-10, 10))
-            self.matrix.append(row)
+
+    FILE_MAGIC = b"PLMX"                            # Identifies the binary matrix file format
+    FILE_HEADER = struct.Struct("<4sBcxxQQ")        # Magic, version, dtype code, padding, rows, columns
+
+    def __init__(self, r: int, c: int, useNumpy: bool = None) -> None:
+        if useNumpy is None:
+            useNumpy = np is not None
+        self.useNumpy = useNumpy and np is not None     # Whether the matrix is stored as a float64 ndarray
+        self.matrix = Matrix._random_data(r, c, -10, 10, None, self.useNumpy)  # Matrix stored as a 2D list or ndarray
+        self._columns = None        # Cached list of the columns in the matrix, found when first needed
+        self.lu = None              # Cached LU decomposition, cleared whenever the matrix is changed
         self.dimensions = (r, c)    # Stores matrix dimensions to check validity of operations
-        self.calculate_columns()    # Finds columns in matrix
+
+    # Creates a matrix filled with zeros
+    @staticmethod
+    def zeros(r, c, useNumpy=None):
+        if Matrix._numpy_enabled(useNumpy):
+            return Matrix._wrap(np.zeros((r, c)), True)
+        return Matrix._wrap([[0] * c for i in range(r)], False)
+
+    # Creates an n x n identity matrix
+    @staticmethod
+    def identity(n, useNumpy=None):
+        if Matrix._numpy_enabled(useNumpy):
+            return Matrix._wrap(np.eye(n), True)
+        return Matrix._wrap([[1 if i == j else 0 for j in range(n)] for i in range(n)], False)
+
+    # Creates a matrix from a list of rows, copying them
+    @staticmethod
+    def from_rows(rows, useNumpy=None):
+        if Matrix._numpy_enabled(useNumpy):
+            return Matrix._wrap(np.array(rows, dtype=np.float64), True)
+        return Matrix._wrap([list(row) for row in rows], False)
+
+    # Creates an r x c matrix over a buffer of row-major float64 values (bytes, bytearray, array('d'), memoryview...)
+    # With NumPy the matrix shares the buffer's memory, which is read only for immutable buffers such as bytes
+    # Without NumPy the values are copied into lists
+    @staticmethod
+    def from_buffer(buffer, r, c, useNumpy=None):
+        view = memoryview(buffer).cast('B')
+        if len(view) != r * c * 8:
+            print("Invalid buffer size")
+            return None
+        if Matrix._numpy_enabled(useNumpy):
+            return Matrix._wrap(np.frombuffer(view, dtype=np.float64).reshape(r, c), True)
+        flat = view.cast('d')
+        return Matrix._wrap([flat[i * c:(i + 1) * c].tolist() for i in range(r)], False)
+
+    # Creates a matrix of random integers between low and high inclusive, filled in one bulk call
+    # Giving a seed makes the values reproducible
+    @staticmethod
+    def random(r, c, low=-10, high=10, seed=None, useNumpy=None):
+        useNumpy = Matrix._numpy_enabled(useNumpy)
+        return Matrix._wrap(Matrix._random_data(r, c, low, high, seed, useNumpy), useNumpy)
+
+    # Returns row i of the matrix
+    def get_row(self, i):
+        return self.matrix[i]
+
+    # Returns column j of the matrix, reading it straight from the row storage
+    def get_column(self, j):
+        if self.useNumpy:
+            return self.matrix[:, j]
+        return [row[j] for row in self.matrix]
+
+    # Saves the matrix in the binary matrix format: a header holding the dimensions and dtype, then row-major float64 data
+    def save(self, path):
+        r, c = self.dimensions
+        with open(path, "wb") as f:
+            f.write(Matrix.FILE_HEADER.pack(Matrix.FILE_MAGIC, 1, b"d", r, c))
+            if self.useNumpy:
+                np.ascontiguousarray(self.matrix, dtype="<f8").tofile(f)
+            else:
+                for row in self.matrix:
+                    f.write(array('d', row).tobytes())
+
+    # Creates a binary matrix file of zeros and maps it, ready to be written to
+    @staticmethod
+    def create_mmap(path, r, c, useNumpy=None):
+        with open(path, "wb") as f:
+            f.write(Matrix.FILE_HEADER.pack(Matrix.FILE_MAGIC, 1, b"d", r, c))
+            f.truncate(Matrix.FILE_HEADER.size + r * c * 8)
+        return Matrix.open_mmap(path, "r+", useNumpy)
+
+    # Maps a binary matrix file into memory without reading it, so that only the rows and columns used are loaded
+    # The mode is "r" for read only access or "r+" to write changes back to the file
+    @staticmethod
+    def open_mmap(path, mode="r", useNumpy=None):
+        with open(path, "rb") as f:
+            header = f.read(Matrix.FILE_HEADER.size)
+        if len(header) != Matrix.FILE_HEADER.size:
+            print("Invalid matrix file")
+            return None
+        magic, version, dtype, r, c = Matrix.FILE_HEADER.unpack(header)
+        if magic != Matrix.FILE_MAGIC or version != 1 or dtype != b"d":
+            print("Invalid matrix file")
+            return None
+        if Matrix._numpy_enabled(useNumpy):
+            data = np.memmap(path, dtype="<f8", mode=mode, offset=Matrix.FILE_HEADER.size, shape=(r, c))
+            result = Matrix._wrap(data, True)
+            result.matrix = data
+            return result
+        result = Matrix._wrap(_MappedRows(path, mode, Matrix.FILE_HEADER.size, r, c), False)
+        result.dimensions = (r, c)
+        return result
+
+    # Writes any changes to a memory mapped matrix back to its file
+    def flush(self):
+        if hasattr(self.matrix, "flush"):
+            self.matrix.flush()
+
+    # Multiplies two matrices in blocks so that only blockSize rows or columns of each operand are in memory at once
+    # Works with memory mapped matrices, and writes the result to a new binary matrix file if a path is given
+    @staticmethod
+    def blocked_multiply(m1, m2, blockSize=1024, path=None):
+        if m1.dimensions[1] != m2.dimensions[0]:
+            print("Invalid matrix dimensions")
+            return m1
+        r, k = m1.dimensions
+        c = m2.dimensions[1]
+        useNumpy = m1.useNumpy or m2.useNumpy
+        result = Matrix.zeros(r, c, useNumpy) if path is None else Matrix.create_mmap(path, r, c, useNumpy)
+        if useNumpy:
+            a = m1.matrix if m1.useNumpy else Matrix._as_array(m1)
+            b = m2.matrix if m2.useNumpy else Matrix._as_array(m2)
+            for i0 in range(0, r, blockSize):
+                i1 = min(i0 + blockSize, r)
+                for j0 in range(0, c, blockSize):
+                    j1 = min(j0 + blockSize, c)
+                    block = np.zeros((i1 - i0, j1 - j0))
+                    for k0 in range(0, k, blockSize):
+                        k1 = min(k0 + blockSize, k)
+                        block += a[i0:i1, k0:k1] @ b[k0:k1, j0:j1]
+                    result.matrix[i0:i1, j0:j1] = block
+        else:
+            # Each block of rows from m1 streams through the rows of m2 once
+            for i0 in range(0, r, blockSize):
+                i1 = min(i0 + blockSize, r)
+                rows = [list(m1.matrix[i]) for i in range(i0, i1)]
+                block = [[0] * c for i in range(i0, i1)]
+                for n in range(k):
+                    otherRow = list(m2.matrix[n])
+                    for row, newRow in zip(rows, block):
+                        a = row[n]
+                        if a != 0:
+                            for j, b in enumerate(otherRow):
+                                newRow[j] += a * b
+                for i, newRow in zip(range(i0, i1), block):
+                    result.matrix[i] = newRow
+        result.flush()
+        return result
+
+    # Returns whether a new matrix should use ndarray storage
+    @staticmethod
+    def _numpy_enabled(useNumpy):
+        return np is not None and (useNumpy is None or useNumpy)
+
+    # Generates r x c random integers between low and high inclusive as an ndarray or a 2D list
+    @staticmethod
+    def _random_data(r, c, low, high, seed, useNumpy):
+        if useNumpy:
+            return np.random.default_rng(seed).integers(low, high, size=(r, c), endpoint=True).astype(np.float64)
+        generator = random if seed is None else random.Random(seed)
+        flat = generator.choices(range(low, high + 1), k=r * c)
+        return [flat[i * c:(i + 1) * c] for i in range(r)]
 
     # Sets a specified index i row to be equal to parameter row v
     def set_row(self, i, v):
         if len(v) != self.dimensions[1]:
             print("Invalid row size")
             return
+        self.lu = None
         self.matrix[i] = v
-        self.calculate_columns()
+        if not self.useNumpy:
+            self._columns = None
 
     # Sets a specified index i column to be equal to parameter column v
     def set_column(self, i, v):
         if len(v) != self.dimensions[0]:
             print("Invalid column size")
             return
+        self.lu = None
+        if self.useNumpy:
+            self.matrix[:, i] = v
+            return
         for r in range(len(self.matrix)):
             self.matrix[r][i] = v[r]
-        self.calculate_columns()
+        self._columns = None
+
+    # The columns in the matrix, only recalculated after set_row or set_column has changed the matrix
+    # For ndarray storage the columns are a transposed view, so they never need recalculating
+    @property
+    def columns(self):
+        if self._columns is None:
+            self.calculate_columns()
+        return self._columns
 
     # Finds columns in matrix
     def calculate_columns(self):
-        self.columns = [ n for n in zip(*self.matrix)]
+        if self.useNumpy:
+            self._columns = self.matrix.T
+        else:
+            self._columns = [ n for n in zip(*self.matrix)]
 
     # Returns matrix in string form to be nicely displayed or stored
     def display(self):
-        total = ""
-        rowLength = 0
-        for row in self.matrix:
-            r = "\n|"
-            for item in row:
-                r += str(item) + " "
-            total +=  r[0:-1] + "|"
-            rowLength = max(rowLength, len(r[0:-1]))
-        caps = ""
-        for i in range(rowLength):
-            caps += "_"
-        total = caps + total + "\n" + caps
-        return total
-    
+        rows = self.matrix
+        if self.useNumpy:
+            # Integral values are shown without the trailing .0 that float64 storage would add, as with list storage
+            rows = [[int(item) if item.is_integer() else item for item in row] for row in self.matrix.tolist()]
+        lines = [" ".join(map(str, row)) for row in rows]
+        rowLength = max((len(line) + 2 for line in lines), default=0)
+        caps = "_" * rowLength
+        return caps + "".join("\n|" + line + "|" for line in lines) + "\n" + caps
+
+    # Returns the matrix data as a contiguous float64 ndarray
+    @staticmethod
+    def _as_array(m):
+        if m.useNumpy:
+            return m.matrix
+        return np.array(m.matrix, dtype=np.float64)
+
+    # Creates a matrix that takes ownership of the given 2D list or ndarray, without copying it where possible
+    @staticmethod
+    def _wrap(data, useNumpy):
+        result = Matrix.__new__(Matrix)
+        result.useNumpy = useNumpy
+        result._columns = None
+        result.lu = None
+        if result.useNumpy:
+            result.matrix = np.ascontiguousarray(data, dtype=np.float64)
+            result.dimensions = result.matrix.shape
+        else:
+            result.matrix = data
+            result.dimensions = (len(data), len(data[0]) if data else 0)
+        return result
+
+    # Returns a lazy expression for the matrix, so that add and multiply build an expression instead of evaluating
+    @staticmethod
+    def lazy(m):
+        return MatrixExpression("leaf", [m], m.dimensions)
+
     # Static method to add two matrices together
     @staticmethod
     def add(m1, m2):
+        if isinstance(m1, MatrixExpression) or isinstance(m2, MatrixExpression):
+            return MatrixExpression.combine("add", m1, m2)
+        if isinstance(m1, SparseMatrix) or isinstance(m2, SparseMatrix):
+            return SparseMatrix.add(m1, m2)
         if m1.dimensions != m2.dimensions:
             print("Invalid matrix dimensions")
             return m1
-        result = Matrix(m1.dimensions[0], m2.dimensions[1])
-        for i in range(m1.dimensions[0]):
-            row = m1.matrix[i]
-            for j, item in enumerate(m2.matrix[i]):
-                row[j] += item
-            result.set_row(i, row)
-        return result
+        if m1.useNumpy or m2.useNumpy:
+            return Matrix._wrap(Matrix._as_array(m1) + Matrix._as_array(m2), True)
+        return Matrix._wrap([[a + b for a, b in zip(row1, row2)] for row1, row2 in zip(m1.matrix, m2.matrix)], False)
 
     # Static method to multiply two matrices together
     @staticmethod 
     def multiply(m1, m2):
+        if isinstance(m1, MatrixExpression) or isinstance(m2, MatrixExpression):
+            return MatrixExpression.combine("multiply", m1, m2)
+        if isinstance(m1, SparseMatrix) or isinstance(m2, SparseMatrix):
+            return SparseMatrix.multiply(m1, m2)
         if m1.dimensions[1] != m2.dimensions[0]:
             print("Invalid matrix dimensions")
             return m1
-        result = Matrix(m1.dimensions[0], m2.dimensions[1])
+        if m1.useNumpy or m2.useNumpy:
+            a = np.ascontiguousarray(Matrix._as_array(m1), dtype=np.float64)
+            b = np.ascontiguousarray(Matrix._as_array(m2), dtype=np.float64)
+            out = np.empty((a.shape[0], b.shape[1]), dtype=np.float64)
+            _row_block_product(a, b, out, 0, a.shape[0])
+            return Matrix._wrap(out, True)
+        rows = []
         for row in range(m1.dimensions[0]):
             newRow = []
             for col in range(m2.dimensions[1]):
                 newRow.append(sum([ i[0] * i[1] for i in zip(m1.matrix[row], m2.columns[col]) ]))
-            result.set_row(row, newRow)
-        return result
+            rows.append(newRow)
+        return Matrix._wrap(rows, False)
 
-    # Returns the determinant of a given matrix
+    # Multiplies two matrices across a pool of worker processes, splitting the result into tileSize x tileSize tiles
+    # The operands and result live in shared memory so that workers only receive the tile bounds
+    # With list storage every element is summed in the same order as multiply, so the result is identical,
+    # including integer results up to 2 ** 53. With NumPy storage the tiles are bands of whole rows, rounded to a
+    # multiple of _KERNEL_ROWS, and are computed with the same row block products as multiply, so the result is identical
+    # Callers on platforms that spawn processes must guard their entry point with if __name__ == '__main__'
+    @staticmethod
+    def parallel_multiply(m1, m2, workers=None, tileSize=128):
+        if m1.dimensions[1] != m2.dimensions[0]:
+            print("Invalid matrix dimensions")
+            return m1
+        r, k = m1.dimensions
+        c = m2.dimensions[1]
+        useNumpy = m1.useNumpy or m2.useNumpy
+        integral = not useNumpy and all(type(n) is int for m in (m1, m2) for row in m.matrix for n in row)
+        blocks = [shared_memory.SharedMemory(create=True, size=max(8 * n, 8)) for n in (r * k, k * c, r * c)]
+        try:
+            Matrix._write_shared(blocks[0], m1, useNumpy)
+            Matrix._write_shared(blocks[1], m2, useNumpy)
+            names = tuple(block.name for block in blocks)
+            if useNumpy:
+                band = max(1, -(-tileSize // _KERNEL_ROWS)) * _KERNEL_ROWS
+                tasks = [(names, (r, k, c), (i, min(i + band, r), 0, c), useNumpy) for i in range(0, r, band)]
+            else:
+                tasks = [(names, (r, k, c), (i, min(i + tileSize, r), j, min(j + tileSize, c)), useNumpy)
+                         for i in range(0, r, tileSize) for j in range(0, c, tileSize)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for _ in pool.map(_multiply_tile, tasks):
+                    pass
+            if useNumpy:
+                return Matrix._wrap(np.ndarray((r, c), dtype=np.float64, buffer=blocks[2].buf).copy(), True)
+            flat = blocks[2].buf.cast('d')
+            rows = [flat[i * c:(i + 1) * c].tolist() for i in range(r)]
+            flat.release()
+            if integral:
+                rows = [[int(n) for n in row] for row in rows]
+            return Matrix._wrap(rows, False)
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    # Copies a matrix into a shared memory block as row-major float64 data
+    @staticmethod
+    def _write_shared(block, m, useNumpy):
+        r, c = m.dimensions
+        if useNumpy:
+            np.ndarray((r, c), dtype=np.float64, buffer=block.buf)[:] = Matrix._as_array(m)
+            return
+        flat = block.buf.cast('d')
+        for i, row in enumerate(m.matrix):
+            flat[i * c:(i + 1) * c] = array('d', row)
+        flat.release()
+
+    # Returns the determinant of a given matrix or 2D list
     @staticmethod
     def determinant(m):
-        if(len(m) == 2):
-            value = m[0][0] * m[1][1] - m[1][0] * m[0][1]
-            return value
-        sum = 0
-        for col in range(len(m)):
-            sign = (-1) ** (col)
-            d = Matrix.determinant(Matrix.get_cofactor(m, 0, col))
-            sum += (sign * m[0][col] * d)
-        return sum
+        if isinstance(m, SparseMatrix):
+            return SparseMatrix.determinant(m)
+        if isinstance(m, Matrix):
+            if m.dimensions[0] != m.dimensions[1]:
+                print("Invalid matrix dimensions")
+                return None
+            if m.useNumpy:
+                if np.isfinite(m.matrix).all() and (m.matrix == np.floor(m.matrix)).all():
+                    return Matrix._bareiss([[int(item) for item in row] for row in m.matrix.tolist()])
+            elif all(_is_integral(item) for row in m.matrix for item in row):
+                return Matrix._bareiss([[int(item) for item in row] for row in m.matrix])
+            lu, perm, sign = m.lu_decompose()
+        else:
+            if all(_is_integral(item) for row in m for item in row):
+                return Matrix._bareiss([[int(item) for item in row] for row in m])
+            lu, perm, sign = Matrix._lu_lists(m)
+        value = sign
+        for i in range(len(lu)):
+            value *= lu[i][i]
+        return float(value)
+
+    # Finds the determinant of a square matrix of integers exactly with fraction-free Bareiss elimination
+    # Every division is exact, so the entries stay integers and the result is an int, in O(n³) steps
+    @staticmethod
+    def _bareiss(rows):
+        n = len(rows)
+        sign = 1
+        previous = 1
+        for k in range(n):
+            if rows[k][k] == 0:
+                swap = next((i for i in range(k + 1, n) if rows[i][k] != 0), None)
+                if swap is None:
+                    return 0
+                rows[k], rows[swap] = rows[swap], rows[k]
+                sign = -sign
+            pivotRow = rows[k]
+            pivot = pivotRow[k]
+            for i in range(k + 1, n):
+                row = rows[i]
+                factor = row[k]
+                for j in range(k + 1, n):
+                    row[j] = (row[j] * pivot - factor * pivotRow[j]) // previous
+            previous = pivot
+        return sign * previous
+
+    # Returns the inverse of the matrix, reusing its cached LU decomposition
+    def inverse(self):
+        inverse = self._lu_solve(Matrix.identity(self.dimensions[0], self.useNumpy).matrix)
+        return None if inverse is None else Matrix._wrap(inverse, self.useNumpy)
+
+    # Solves the linear system Ax = b for x, where b is a vector or a Matrix of right-hand side columns
+    def solve(self, b):
+        if isinstance(b, Matrix):
+            if b.dimensions[0] != self.dimensions[0]:
+                print("Invalid matrix dimensions")
+                return None
+            x = self._lu_solve(Matrix._as_array(b) if self.useNumpy else b.matrix)
+            return None if x is None else Matrix._wrap(x, self.useNumpy)
+        if len(b) != self.dimensions[0]:
+            print("Invalid vector size")
+            return None
+        if self.useNumpy:
+            x = self._lu_solve(np.asarray(b, dtype=np.float64))
+            return x if x is None or isinstance(b, np.ndarray) else x.tolist()
+        x = self._lu_solve([[item] for item in b])
+        return None if x is None else [row[0] for row in x]
+
+    # Gets the LU decomposition of the matrix with partial pivoting, as (lu, perm, sign)
+    # lu holds L (unit diagonal, below) and U (on and above the diagonal) in one square array,
+    # perm is the row permutation and sign its parity. The result is cached until set_row or set_column is used
+    def lu_decompose(self):
+        if self.lu is None:
+            if self.dimensions[0] != self.dimensions[1]:
+                print("Invalid matrix dimensions")
+                return None
+            self.lu = Matrix._lu_array(self.matrix) if self.useNumpy else Matrix._lu_lists(self.matrix)
+        return self.lu
+
+    # LU decomposition with partial pivoting for a 2D list
+    @staticmethod
+    def _lu_lists(m):
+        n = len(m)
+        lu = [[float(item) for item in row] for row in m]
+        perm = list(range(n))
+        sign = 1
+        for k in range(n):
+            p = max(range(k, n), key=lambda i: abs(lu[i][k]))
+            if lu[p][k] == 0:
+                continue
+            if p != k:
+                lu[k], lu[p] = lu[p], lu[k]
+                perm[k], perm[p] = perm[p], perm[k]
+                sign = -sign
+            pivotRow = lu[k]
+            pivot = pivotRow[k]
+            for i in range(k + 1, n):
+                row = lu[i]
+                factor = row[k] / pivot
+                row[k] = factor
+                if factor != 0:
+                    for j in range(k + 1, n):
+                        row[j] -= factor * pivotRow[j]
+        return lu, perm, sign
+
+    # LU decomposition with partial pivoting for an ndarray, updating the trailing block with one outer product per step
+    @staticmethod
+    def _lu_array(m):
+        lu = np.array(m, dtype=np.float64)
+        n = lu.shape[0]
+        perm = np.arange(n)
+        sign = 1
+        for k in range(n):
+            p = k + int(np.argmax(np.abs(lu[k:, k])))
+            if lu[p, k] == 0:
+                continue
+            if p != k:
+                lu[[k, p]] = lu[[p, k]]
+                perm[[k, p]] = perm[[p, k]]
+                sign = -sign
+            lu[k + 1:, k] /= lu[k, k]
+            lu[k + 1:, k + 1:] -= np.outer(lu[k + 1:, k], lu[k, k + 1:])
+        return lu, perm, sign
+
+    # Solves for each column of b using forward and back substitution on the cached LU decomposition
+    # Returns None if the matrix is singular
+    def _lu_solve(self, b):
+        decomposition = self.lu_decompose()
+        if decomposition is None:
+            return None
+        lu, perm, sign = decomposition
+        n = len(lu)
+        if any(lu[i][i] == 0 for i in range(n)):
+            print("Matrix is singular")
+            return None
+        if self.useNumpy:
+            x = np.array(b, dtype=np.float64)[perm]
+            for i in range(n):
+                x[i] -= lu[i, :i] @ x[:i]
+            for i in range(n - 1, -1, -1):
+                x[i] = (x[i] - lu[i, i + 1:] @ x[i + 1:]) / lu[i, i]
+            return x
+        x = [[float(item) for item in b[p]] for p in perm]
+        for i in range(n):
+            row = x[i]
+            for k in range(i):
+                factor = lu[i][k]
+                if factor != 0:
+                    for j, item in enumerate(x[k]):
+                        row[j] -= factor * item
+        for i in range(n - 1, -1, -1):
+            row = x[i]
+            for k in range(i + 1, n):
+                factor = lu[i][k]
+                if factor != 0:
+                    for j, item in enumerate(x[k]):
+                        row[j] -= factor * item
+            pivot = lu[i][i]
+            x[i] = [item / pivot for item in row]
+        return x
 
     # Gets a sub-matrix to use for determinant calculation
     @staticmethod
     def get_cofactor(m, i, j):
         return [row[: j] + row[j+1:] for row in (m[: i] + m[i+1:])]
 
+# Row storage for a memory mapped matrix without NumPy
+# Each row is a float64 memoryview into the mapped file, so rows are only read from disk when used
+class _MappedRows:
+    def __init__(self, path, mode, offset, r, c):
+        with open(path, "r+b" if mode == "r+" else "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if mode == "r+" else mmap.ACCESS_READ)
+        self.data = memoryview(self.map)[offset:offset + r * c * 8].cast('d')
+        self.r = r
+        self.c = c
+
+    def __len__(self):
+        return self.r
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.r
+        if not 0 <= i < self.r:
+            raise IndexError("row index out of range")
+        return self.data[i * self.c:(i + 1) * self.c]
+
+    def __setitem__(self, i, row):
+        self[i][:] = array('d', row)
+
+    def __iter__(self):
+        for i in range(self.r):
+            yield self[i]
+
+    def flush(self):
+        self.map.flush()
+
+# Rows per BLAS call in NumPy matrix products
+# multiply and parallel_multiply both compute rows in blocks of this size starting from row 0, so each output
+# element comes from an identical call and the two agree bit for bit
+_KERNEL_ROWS = 64
+
+# Writes rows i0 to i1 of a @ b into out, one _KERNEL_ROWS block at a time
+# i0 must be a multiple of _KERNEL_ROWS and a and b must be C contiguous float64 arrays
+def _row_block_product(a, b, out, i0, i1):
+    for i in range(i0, i1, _KERNEL_ROWS):
+        end = min(i + _KERNEL_ROWS, i1)
+        out[i:end] = a[i:end] @ b
+
+# Computes one tile of a parallel matrix product inside a worker process
+# Each item is a full dot product over the shared dimension, in the same order as the serial path
+# With NumPy storage a tile is a band of whole rows computed by _row_block_product
+def _multiply_tile(task):
+    names, (r, k, c), (i0, i1, j0, j1), useNumpy = task
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    try:
+        if useNumpy:
+            a = np.ndarray((r, k), dtype=np.float64, buffer=blocks[0].buf)
+            b = np.ndarray((k, c), dtype=np.float64, buffer=blocks[1].buf)
+            out = np.ndarray((r, c), dtype=np.float64, buffer=blocks[2].buf)
+            _row_block_product(a, b, out, i0, i1)
+            del a, b, out
+            return
+        a = blocks[0].buf.cast('d')
+        b = blocks[1].buf.cast('d')
+        out = blocks[2].buf.cast('d')
+        columns = [b[j::c].tolist() for j in range(j0, j1)]
+        for i in range(i0, i1):
+            row = a[i * k:(i + 1) * k].tolist()
+            out[i * c + j0:i * c + j1] = array('d', [sum([ n[0] * n[1] for n in zip(row, column) ]) for column in columns])
+        for view in (a, b, out):
+            view.release()
+    finally:
+        for block in blocks:
+            block.close()
+
+# Python SparseMatrix object
+# Stores mostly-zero matrices in compressed sparse row (CSR) form and has static methods that skip the zeros
+# Matrix.add, Matrix.multiply and Matrix.determinant dispatch here when either operand is sparse
+# Dependencies : None (optional: numpy)
+class SparseMatrix:
+    def __init__(self, r, c, data=None, indices=None, indptr=None):
+        self.dimensions = (r, c)                                        # Stores matrix dimensions
+        self.data = data if data is not None else []                    # Non-zero values in row-major order
+        self.indices = indices if indices is not None else []           # Column index of each non-zero value
+        self.indptr = indptr if indptr is not None else [0] * (r + 1)   # Where each row starts in data and indices
+
+    # Returns the number of stored non-zero values
+    def count_nonzero(self):
+        return len(self.data)
+
+    # Returns the column indices and values of the non-zero items in row i
+    def get_row(self, i):
+        start = self.indptr[i]
+        end = self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    # Returns matrix in string form to be nicely displayed or stored
+    def display(self):
+        return self.to_matrix(False).display()
+
+    # Creates a sparse matrix from the non-zero items of a dense Matrix
+    @staticmethod
+    def from_matrix(m):
+        rows = m.matrix.tolist() if m.useNumpy else m.matrix
+        data = []
+        indices = []
+        indptr = [0]
+        for row in rows:
+            for j, item in enumerate(row):
+                if item != 0:
+                    indices.append(j)
+                    data.append(item)
+            indptr.append(len(data))
+        return SparseMatrix(m.dimensions[0], m.dimensions[1], data, indices, indptr)
+
+    # Converts the sparse matrix to a dense Matrix
+    def to_matrix(self, useNumpy=None):
+        r, c = self.dimensions
+        dense = Matrix.zeros(r, c, useNumpy)
+        if dense.useNumpy:
+            dense.matrix[self._row_indices(), self.indices] = self.data
+            return dense
+        for i, row in enumerate(dense.matrix):
+            for j in range(self.indptr[i], self.indptr[i + 1]):
+                row[self.indices[j]] = self.data[j]
+        return dense
+
+    # Returns the row index of every stored value as an ndarray
+    def _row_indices(self):
+        return np.repeat(np.arange(self.dimensions[0]), np.diff(self.indptr))
+
+    # Returns the rows of the matrix as dictionaries of column index to value
+    def _row_dicts(self):
+        return [dict(zip(*self.get_row(i))) for i in range(self.dimensions[0])]
+
+    # Creates a sparse matrix from a list of row dictionaries, dropping any zeros
+    @staticmethod
+    def _from_row_dicts(rows, c):
+        data = []
+        indices = []
+        indptr = [0]
+        for row in rows:
+            for j in sorted(row):
+                if row[j] != 0:
+                    indices.append(j)
+                    data.append(row[j])
+            indptr.append(len(data))
+        return SparseMatrix(len(rows), c, data, indices, indptr)
+
+    # Returns a dense copy of a Matrix's rows for accumulating results into
+    @staticmethod
+    def _dense_copy(m):
+        if m.useNumpy:
+            return np.array(m.matrix)
+        return [list(row) for row in m.matrix]
+
+    # Static method to add two matrices together where at least one is sparse
+    # The result is sparse if both operands are sparse, otherwise it is dense
+    @staticmethod
+    def add(m1, m2):
+        if m1.dimensions != m2.dimensions:
+            print("Invalid matrix dimensions")
+            return m1
+        if isinstance(m1, SparseMatrix) and isinstance(m2, SparseMatrix):
+            rows = m1._row_dicts()
+            for i, row in enumerate(rows):
+                for j, item in zip(*m2.get_row(i)):
+                    row[j] = row.get(j, 0) + item
+            return SparseMatrix._from_row_dicts(rows, m1.dimensions[1])
+        sparse, dense = (m1, m2) if isinstance(m1, SparseMatrix) else (m2, m1)
+        result = SparseMatrix._dense_copy(dense)
+        if dense.useNumpy:
+            result[sparse._row_indices(), sparse.indices] += sparse.data
+        else:
+            for i, row in enumerate(result):
+                for j, item in zip(*sparse.get_row(i)):
+                    row[j] += item
+        return Matrix._wrap(result, dense.useNumpy)
+
+    # Static method to multiply two matrices together where at least one is sparse
+    # The result is sparse if both operands are sparse, otherwise it is dense
+    @staticmethod
+    def multiply(m1, m2):
+        if m1.dimensions[1] != m2.dimensions[0]:
+            print("Invalid matrix dimensions")
+            return m1
+        r = m1.dimensions[0]
+        c = m2.dimensions[1]
+        if isinstance(m1, SparseMatrix) and isinstance(m2, SparseMatrix):
+            rows = []
+            for i in range(r):
+                row = {}
+                for k, a in zip(*m1.get_row(i)):
+                    for j, b in zip(*m2.get_row(k)):
+                        row[j] = row.get(j, 0) + a * b
+                rows.append(row)
+            return SparseMatrix._from_row_dicts(rows, c)
+        if isinstance(m1, SparseMatrix):
+            # Each row of the result is a weighted sum of the dense rows picked out by the sparse row
+            if m2.useNumpy:
+                result = np.zeros((r, c))
+                for i in range(r):
+                    for k, a in zip(*m1.get_row(i)):
+                        result[i] += a * m2.matrix[k]
+                return Matrix._wrap(result, True)
+            result = []
+            for i in range(r):
+                row = [0] * c
+                for k, a in zip(*m1.get_row(i)):
+                    for j, b in enumerate(m2.matrix[k]):
+                        row[j] += a * b
+                result.append(row)
+            return Matrix._wrap(result, False)
+        # Each non-zero item in a dense row scales the matching sparse row into the result
+        rows = m1.matrix.tolist() if m1.useNumpy else m1.matrix
+        result = []
+        for denseRow in rows:
+            row = [0] * c
+            for k, a in enumerate(denseRow):
+                if a != 0:
+                    for j, b in zip(*m2.get_row(k)):
+                        row[j] += a * b
+            result.append(row)
+        return Matrix._wrap(result, m1.useNumpy)
+
+    # Returns the determinant of a sparse matrix using Gaussian elimination over its non-zero items only
+    @staticmethod
+    def determinant(m):
+        if m.dimensions[0] != m.dimensions[1]:
+            print("Invalid matrix dimensions")
+            return None
+        rows = m._row_dicts()
+        n = len(rows)
+        if all(_is_integral(item) for item in m.data):
+            return SparseMatrix._bareiss([{j: int(item) for j, item in row.items()} for row in rows])
+        value = 1.0
+        for k in range(n):
+            pivot = max(range(k, n), key=lambda i: abs(rows[i].get(k, 0)))
+            if rows[pivot].get(k, 0) == 0:
+                return 0.0
+            if pivot != k:
+                rows[k], rows[pivot] = rows[pivot], rows[k]
+                value = -value
+            pivotRow = rows[k]
+            pivotValue = pivotRow[k]
+            value *= pivotValue
+            for i in range(k + 1, n):
+                row = rows[i]
+                if k not in row:
+                    continue
+                factor = row.pop(k) / pivotValue
+                for j, item in pivotRow.items():
+                    if j > k:
+                        row[j] = row.get(j, 0) - factor * item
+        return value
+
+    # Finds the determinant of a square matrix of integers, given as row dictionaries, exactly with Bareiss elimination
+    # Rows without an item in the pivot column are only rescaled, so zeros are never filled in for them
+    @staticmethod
+    def _bareiss(rows):
+        n = len(rows)
+        sign = 1
+        previous = 1
+        for k in range(n):
+            if rows[k].get(k, 0) == 0:
+                swap = next((i for i in range(k + 1, n) if rows[i].get(k, 0) != 0), None)
+                if swap is None:
+                    return 0
+                rows[k], rows[swap] = rows[swap], rows[k]
+                sign = -sign
+            pivotRow = rows[k]
+            pivot = pivotRow[k]
+            for i in range(k + 1, n):
+                row = rows[i]
+                factor = row.pop(k, 0)
+                updated = {j: item * pivot for j, item in row.items() if j > k}
+                if factor != 0:
+                    for j, item in pivotRow.items():
+                        if j > k:
+                            updated[j] = updated.get(j, 0) - factor * item
+                rows[i] = {j: item // previous for j, item in updated.items() if item != 0}
+            previous = pivot
+        return sign * previous
+
+# Python MatrixExpression object
+# A lazily evaluated sum or product of matrices, built by Matrix.add and Matrix.multiply when either operand is lazy
+# Products are evaluated in the cheapest order found by the matrix-chain algorithm, and sums are fused into one pass
+# Dependencies : None (optional: numpy)
+class MatrixExpression:
+    def __init__(self, operation, operands, dimensions):
+        self.operation = operation      # "leaf", "add" or "multiply"
+        self.operands = operands        # The matrix for a leaf, otherwise the flattened list of sub-expressions
+        self.dimensions = dimensions    # Dimensions of the evaluated result
+
+    def __add__(self, other):
+        return Matrix.add(self, other)
+
+    def __radd__(self, other):
+        return Matrix.add(other, self)
+
+    def __matmul__(self, other):
+        return Matrix.multiply(self, other)
+
+    def __rmatmul__(self, other):
+        return Matrix.multiply(other, self)
+
+    # Builds an add or multiply expression, flattening nested expressions of the same operation into one node
+    @staticmethod
+    def combine(operation, m1, m2):
+        if not isinstance(m1, MatrixExpression):
+            m1 = Matrix.lazy(m1)
+        if not isinstance(m2, MatrixExpression):
+            m2 = Matrix.lazy(m2)
+        if operation == "add":
+            valid = m1.dimensions == m2.dimensions
+            dimensions = m1.dimensions
+        else:
+            valid = m1.dimensions[1] == m2.dimensions[0]
+            dimensions = (m1.dimensions[0], m2.dimensions[1])
+        if not valid:
+            print("Invalid matrix dimensions")
+            return m1
+        operands = []
+        for m in (m1, m2):
+            if m.operation == operation:
+                operands.extend(m.operands)
+            else:
+                operands.append(m)
+        return MatrixExpression(operation, operands, dimensions)
+
+    # Evaluates the expression into a Matrix
+    def evaluate(self):
+        if self.operation == "leaf":
+            return self.operands[0]
+        if self.operation == "add":
+            return MatrixExpression._evaluate_sum([m.evaluate() for m in self.operands])
+        return MatrixExpression._evaluate_chain([m.evaluate() for m in self.operands])
+
+    # Returns the minimum number of scalar multiplications to evaluate a chain of products
+    # and the split table giving the optimal parenthesisation
+    @staticmethod
+    def chain_order(dimensions):
+        n = len(dimensions)
+        p = [d[0] for d in dimensions] + [dimensions[-1][1]]
+        cost = [[0] * n for i in range(n)]
+        split = [[0] * n for i in range(n)]
+        for length in range(2, n + 1):
+            for i in range(n - length + 1):
+                j = i + length - 1
+                cost[i][j] = None
+                for k in range(i, j):
+                    c = cost[i][k] + cost[k + 1][j] + p[i] * p[k + 1] * p[j + 1]
+                    if cost[i][j] is None or c < cost[i][j]:
+                        cost[i][j] = c
+                        split[i][j] = k
+        return cost[0][n - 1], split
+
+    # Multiplies a chain of matrices using the optimal parenthesisation
+    @staticmethod
+    def _evaluate_chain(matrices):
+        cost, split = MatrixExpression.chain_order([m.dimensions for m in matrices])
+
+        def product(i, j):
+            if i == j:
+                return matrices[i]
+            k = split[i][j]
+            return Matrix.multiply(product(i, k), product(k + 1, j))
+
+        return product(0, len(matrices) - 1)
+
+    # Adds any number of matrices in one pass without creating intermediate sums
+    @staticmethod
+    def _evaluate_sum(matrices):
+        if any(isinstance(m, SparseMatrix) for m in matrices):
+            total = matrices[0]
+            for m in matrices[1:]:
+                total = Matrix.add(total, m)
+            return total
+        if any(m.useNumpy for m in matrices):
+            total = np.array(Matrix._as_array(matrices[0]), dtype=np.float64)
+            for m in matrices[1:]:
+                np.add(total, Matrix._as_array(m), out=total)
+            return Matrix._wrap(total, True)
+        rows = [[sum(items) for items in zip(*row)] for row in zip(*(m.matrix for m in matrices))]
+        return Matrix._wrap(rows, False)
+
 # Python Vector2 object
-# Stores 2D vectors as a tuple and has static methods to use with vectors
+# A compact 2D vector with operator overloads, in-place updates and static methods to use with vectors
+# The magnitude is only calculated when read, and is cached until the components change
 # Dependencies : math
 class Vector2:
+    __slots__ = ("x", "y", "_magnitude", "_magnitudeX", "_magnitudeY")
+
     def __init__(self, x, y):
         self.x = x                          # The x component of the vector
         self.y = y                          # The y component of the vecor
-        self.vector = (x, y)                # The vector as a tuple
-        self.magnitude =  math.hypot(x, y)  # The magnitude of the vector
+        self._magnitude = None              # Cached magnitude, valid while x and y match the values it was found for
+
+    # The vector as a tuple
+    @property
+    def vector(self):
+        return (self.x, self.y)
+
+    # The magnitude of the vector
+    @property
+    def magnitude(self):
+        x = self.x
+        y = self.y
+        if self._magnitude is None or x != self._magnitudeX or y != self._magnitudeY:
+            self._magnitude = math.hypot(x, y)
+            self._magnitudeX = x
+            self._magnitudeY = y
+        return self._magnitude
+
+    def __repr__(self):
+        return f"Vector2({self.x}, {self.y})"
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, i):
+        return (self.x, self.y)[i]
+
+    def __neg__(self):
+        return Vector2(-self.x, -self.y)
+
+    def __add__(self, other):
+        return Vector2(self.x + other.x, self.y + other.y)
+
+    def __sub__(self, other):
+        return Vector2(self.x - other.x, self.y - other.y)
+
+    def __mul__(self, scalar):
+        return Vector2(self.x * scalar, self.y * scalar)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, scalar):
+        return Vector2(self.x / scalar, self.y / scalar)
+
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        return self
+
+    def __isub__(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        return self
+
+    def __imul__(self, scalar):
+        self.x *= scalar
+        self.y *= scalar
+        return self
+
+    def __itruediv__(self, scalar):
+        self.x /= scalar
+        self.y /= scalar
+        return self
+
+    # Adds another vector to this vector in place
+    def iadd(self, v):
+        self.x += v.x
+        self.y += v.y
+        return self
+
+    # Subtracts another vector from this vector in place
+    def isub(self, v):
+        self.x -= v.x
+        self.y -= v.y
+        return self
+
+    # Sets both components of the vector in place
+    def set(self, x, y):
+        self.x = x
+        self.y = y
+        return self
+
+    # Scales this vector to a magnitude of 1 in place
+    def normalize_ip(self):
+        magnitude = self.magnitude
+        self.x /= magnitude
+        self.y /= magnitude
+        return self
 
     # Adds 2 vectors together and returns as a vector
     @staticmethod
@@ -130,9 +1162,319 @@ class Vector2:
     # Finds the dot product of two vectors
     @staticmethod
     def dot(v1, v2):
-        return sum([i[0] * i[1] for i in zip(v1.vector, v2.vector)])
+        return v1.x * v2.x + v1.y * v2.y
 
     # Returns the unit vector of the given vector
     @staticmethod
     def unit(v):
-        return Vector2(v.x / v.magnitude, v.y / v.magnitude)
\ No newline at end of file
+        magnitude = v.magnitude
+        return Vector2(v.x / magnitude, v.y / magnitude)
+
+# Python Vector2Array object
+# Stores a batch of 2D vectors as two contiguous float arrays and has static methods to operate on whole batches
+# Operations accept a Vector2 in place of either batch, which is applied to every vector in the other batch
+# Dependencies : math, operator, array, itertools (optional: numpy)
+class Vector2Array:
+    def __init__(self, xs, ys):
+        if len(xs) != len(ys):
+            raise Exception("Invalid array sizes")
+        if np is not None:
+            self.x = np.array(xs, dtype=np.float64)     # The x components of the vectors
+            self.y = np.array(ys, dtype=np.float64)     # The y components of the vectors
+        else:
+            self.x = array('d', xs)
+            self.y = array('d', ys)
+
+    def __len__(self):
+        return len(self.x)
+
+    # Returns the vector at index i as a Vector2
+    def __getitem__(self, i):
+        return Vector2(float(self.x[i]), float(self.y[i]))
+
+    # The magnitudes of all vectors in the batch
+    @property
+    def magnitude(self):
+        if np is not None:
+            return np.hypot(self.x, self.y)
+        return array('d', map(math.hypot, self.x, self.y))
+
+    # Creates a batch from a list of Vector2 objects
+    @staticmethod
+    def from_vectors(vectors):
+        return Vector2Array([v.x for v in vectors], [v.y for v in vectors])
+
+    # Converts the batch to a list of Vector2 objects
+    def to_vectors(self):
+        xs = self.x.tolist()
+        ys = self.y.tolist()
+        return [Vector2(x, y) for x, y in zip(xs, ys)]
+
+    # Gets the components of a batch or single vector, repeating a single vector's components where needed
+    @staticmethod
+    def _components(v):
+        if isinstance(v, Vector2Array) or np is not None:
+            return v.x, v.y
+        return repeat(v.x), repeat(v.y)
+
+    # Creates a batch directly from two component arrays without copying them
+    @staticmethod
+    def _wrap(xs, ys):
+        result = Vector2Array.__new__(Vector2Array)
+        result.x = xs
+        result.y = ys
+        return result
+
+    # Adds 2 batches of vectors together
+    @staticmethod
+    def add(a, b):
+        ax, ay = Vector2Array._components(a)
+        bx, by = Vector2Array._components(b)
+        if np is not None:
+            return Vector2Array._wrap(ax + bx, ay + by)
+        return Vector2Array._wrap(array('d', map(operator.add, ax, bx)), array('d', map(operator.add, ay, by)))
+
+    # Subtracts one batch of vectors from another
+    @staticmethod
+    def subtract(a, b):
+        ax, ay = Vector2Array._components(a)
+        bx, by = Vector2Array._components(b)
+        if np is not None:
+            return Vector2Array._wrap(ax - bx, ay - by)
+        return Vector2Array._wrap(array('d', map(operator.sub, ax, bx)), array('d', map(operator.sub, ay, by)))
+
+    # Finds the dot products of two batches of vectors
+    @staticmethod
+    def dot(a, b):
+        ax, ay = Vector2Array._components(a)
+        bx, by = Vector2Array._components(b)
+        if np is not None:
+            return ax * bx + ay * by
+        return array('d', (x1 * x2 + y1 * y2 for x1, y1, x2, y2 in zip(ax, ay, bx, by)))
+
+    # Returns the unit vectors of a batch, leaving zero vectors as zero
+    @staticmethod
+    def unit(a):
+        if np is not None:
+            magnitude = a.magnitude
+            safe = np.where(magnitude == 0, 1, magnitude)
+            return Vector2Array._wrap(a.x / safe, a.y / safe)
+        xs = array('d')
+        ys = array('d')
+        for x, y in zip(a.x, a.y):
+            magnitude = math.hypot(x, y) or 1
+            xs.append(x / magnitude)
+            ys.append(y / magnitude)
+        return Vector2Array._wrap(xs, ys)
+
+    # Linearly interpolates between two batches of vectors with a weight or batch of weights, matching lerp
+    @staticmethod
+    def lerp(a, b, w):
+        ax, ay = Vector2Array._components(a)
+        bx, by = Vector2Array._components(b)
+        if np is not None:
+            return Vector2Array._wrap(bx + w * (ax - bx), by + w * (ay - by))
+        ws = w if isinstance(w, (list, tuple, array)) else repeat(w)
+        xs = array('d')
+        ys = array('d')
+        for x1, y1, x2, y2, weight in zip(ax, ay, bx, by, ws):
+            xs.append(x2 + weight * (x1 - x2))
+            ys.append(y2 + weight * (y1 - y2))
+        return Vector2Array._wrap(xs, ys)
+
+# Python SpatialHash object
+# A uniform grid broad phase for circles, points and rectangles, giving candidate pairs and proximity queries
+# Objects are stored under any hashable key, and moving an object only rehashes it if it changes cells
+# Dependencies : math
+class SpatialHash:
+    def __init__(self, cellSize):
+        self.cellSize = cellSize    # Width and height of each grid cell in world units
+        self.cells = {}             # Maps each occupied cell to the set of keys overlapping it
+        self.entries = {}           # Maps each key to [minX, minY, maxX, maxY, radius, cellRange, order]
+        self.count = 0              # Insertion counter used to order pairs
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    # Inserts a circle with a given centre and radius, or a point if the radius is 0
+    def insert(self, key, pos, radius=0):
+        self._insert(key, [pos[0] - radius, pos[1] - radius, pos[0] + radius, pos[1] + radius, radius])
+
+    # Inserts a rectangle given as (x, y, width, height)
+    def insert_rect(self, key, rect):
+        self._insert(key, [rect[0], rect[1], rect[0] + rect[2], rect[1] + rect[3], None])
+
+    # Removes an object
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        self._remove_cells(key, entry[5])
+
+    # Moves an object so that its centre (circles) or top left corner (rectangles) is at pos
+    def move(self, key, pos):
+        entry = self.entries[key]
+        if entry[4] is None:
+            dx = pos[0] - entry[0]
+            dy = pos[1] - entry[1]
+        else:
+            dx = pos[0] - (entry[0] + entry[4])
+            dy = pos[1] - (entry[1] + entry[4])
+        entry[0] += dx
+        entry[1] += dy
+        entry[2] += dx
+        entry[3] += dy
+        cellRange = self._cell_range(entry)
+        if cellRange != entry[5]:
+            self._remove_cells(key, entry[5])
+            self._add_cells(key, cellRange)
+            entry[5] = cellRange
+
+    # Returns the bounding rectangle of an object as (x, y, width, height)
+    def get_rect(self, key):
+        entry = self.entries[key]
+        return (entry[0], entry[1], entry[2] - entry[0], entry[3] - entry[1])
+
+    # Returns every pair of keys whose shapes overlap, testing only objects that share a cell
+    def pairs(self):
+        found = set()
+        result = []
+        for keys in self.cells.values():
+            if len(keys) < 2:
+                continue
+            ordered = sorted(keys, key=lambda k: self.entries[k][6])
+            for i, a in enumerate(ordered):
+                entryA = self.entries[a]
+                for b in ordered[i + 1:]:
+                    pair = (a, b)
+                    if pair not in found and SpatialHash._intersects(entryA, self.entries[b]):
+                        found.add(pair)
+                        result.append(pair)
+        return result
+
+    # Returns the keys of all objects overlapping the rectangle (x, y, width, height)
+    def query_rect(self, rect):
+        query = [rect[0], rect[1], rect[0] + rect[2], rect[1] + rect[3], None]
+        return [key for key in self._candidates(self._cell_range(query)) if SpatialHash._intersects(query, self.entries[key])]
+
+    # Returns the keys of all objects within a radius of a point
+    def query_radius(self, pos, radius):
+        query = [pos[0] - radius, pos[1] - radius, pos[0] + radius, pos[1] + radius, radius]
+        return [key for key in self._candidates(self._cell_range(query)) if SpatialHash._intersects(query, self.entries[key])]
+
+    # Returns the keys of the k objects closest to a point, nearest first, searching outwards one ring of cells at a time
+    def nearest(self, pos, k=1):
+        if k <= 0 or not self.entries:
+            return []
+        cx = math.floor(pos[0] / self.cellSize)
+        cy = math.floor(pos[1] / self.cellSize)
+        best = []
+        seen = set()
+        ring = 0
+        while len(seen) < len(self.entries):
+            if (2 * ring + 1) ** 2 > len(self.cells):
+                # Once the search covers more cells than are occupied, it is cheaper to check the remaining objects directly
+                for key, entry in self.entries.items():
+                    if key not in seen:
+                        best.append((SpatialHash._distance(pos, entry), entry[6], key))
+                best.sort()
+                del best[k:]
+                break
+            for cell in SpatialHash._ring_cells(cx, cy, ring):
+                for key in self.cells.get(cell, ()):
+                    if key not in seen:
+                        seen.add(key)
+                        best.append((SpatialHash._distance(pos, self.entries[key]), self.entries[key][6], key))
+            best.sort()
+            del best[k:]
+            # Objects in further rings are at least ring cells away, so stop once k closer objects are known
+            if len(best) == k and best[-1][0] <= ring * self.cellSize:
+                break
+            ring += 1
+        return [item[2] for item in best]
+
+    # Adds a new entry to the grid
+    def _insert(self, key, entry):
+        if key in self.entries:
+            self.remove(key)
+        cellRange = self._cell_range(entry)
+        entry.append(cellRange)
+        entry.append(self.count)
+        self.count += 1
+        self.entries[key] = entry
+        self._add_cells(key, cellRange)
+
+    # Gets the range of cells (minX, minY, maxX, maxY) covered by an entry's bounds
+    def _cell_range(self, entry):
+        size = self.cellSize
+        return (math.floor(entry[0] / size), math.floor(entry[1] / size), math.floor(entry[2] / size), math.floor(entry[3] / size))
+
+    def _add_cells(self, key, cellRange):
+        for x in range(cellRange[0], cellRange[2] + 1):
+            for y in range(cellRange[1], cellRange[3] + 1):
+                self.cells.setdefault((x, y), set()).add(key)
+
+    def _remove_cells(self, key, cellRange):
+        for x in range(cellRange[0], cellRange[2] + 1):
+            for y in range(cellRange[1], cellRange[3] + 1):
+                keys = self.cells[(x, y)]
+                keys.discard(key)
+                if not keys:
+                    del self.cells[(x, y)]
+
+    # Gets the set of keys in a range of cells
+    def _candidates(self, cellRange):
+        width = cellRange[2] - cellRange[0] + 1
+        height = cellRange[3] - cellRange[1] + 1
+        if width * height > len(self.cells):
+            # Large queries are cheaper to answer by walking the occupied cells
+            found = set()
+            for (x, y), keys in self.cells.items():
+                if cellRange[0] <= x <= cellRange[2] and cellRange[1] <= y <= cellRange[3]:
+                    found.update(keys)
+            return found
+        found = set()
+        for x in range(cellRange[0], cellRange[2] + 1):
+            for y in range(cellRange[1], cellRange[3] + 1):
+                keys = self.cells.get((x, y))
+                if keys:
+                    found.update(keys)
+        return found
+
+    # Gets the cells exactly ring cells away from a centre cell
+    @staticmethod
+    def _ring_cells(cx, cy, ring):
+        if ring == 0:
+            return [(cx, cy)]
+        cells = []
+        for x in range(cx - ring, cx + ring + 1):
+            cells.append((x, cy - ring))
+            cells.append((x, cy + ring))
+        for y in range(cy - ring + 1, cy + ring):
+            cells.append((cx - ring, y))
+            cells.append((cx + ring, y))
+        return cells
+
+    # Gets the distance from a point to the nearest point of an entry's shape
+    @staticmethod
+    def _distance(pos, entry):
+        if entry[4] is None:
+            dx = max(entry[0] - pos[0], 0, pos[0] - entry[2])
+            dy = max(entry[1] - pos[1], 0, pos[1] - entry[3])
+            return math.hypot(dx, dy)
+        return max(math.hypot(pos[0] - entry[0] - entry[4], pos[1] - entry[1] - entry[4]) - entry[4], 0)
+
+    # Checks whether two entries' shapes overlap
+    @staticmethod
+    def _intersects(a, b):
+        if a[0] > b[2] or b[0] > a[2] or a[1] > b[3] or b[1] > a[3]:
+            return False
+        if a[4] is None and b[4] is None:
+            return True
+        if a[4] is not None and b[4] is not None:
+            dx = (a[0] + a[4]) - (b[0] + b[4])
+            dy = (a[1] + a[4]) - (b[1] + b[4])
+            return dx * dx + dy * dy <= (a[4] + b[4]) ** 2
+        circle, box = (a, b) if a[4] is not None else (b, a)
+        return SpatialHash._distance((circle[0] + circle[4], circle[1] + circle[4]), box) <= circle[4]
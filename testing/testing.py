@@ -63,22 +63,12 @@ if __name__ == '__main__':
                 running = False
                 pygame.quit()
                 exit()
-            elif event.type == pygame.KEYDOWN:
-                ui.run_method_on_type(TextBox, "input_key_event", [event])
-            elif event.type == pygame.MOUSEMOTION:
-                ui.run_method_on_type(Button, "hover", [pygame.mouse.get_pos()])
-                ui.run_method_on_type(TextBox, "hover", [pygame.mouse.get_pos()])
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1:
-                    ui.run_method_on_type(Button, "click", [pygame.mouse.get_pos()])
-                    ui.run_method_on_type(TextBox, "click", [pygame.mouse.get_pos()])
-            elif event.type == pygame.MOUSEBUTTONUP:
-                if event.button == 1:
-                    ui.run_method_on_type(Button, "hover", [pygame.mouse.get_pos()])
-                    
+            else:
+                ui.dispatch(event)
+
         win.fill((255, 255, 255))
 
-        ui.run_method_on_type(TextBox, "update_cursor")
+        ui.update_cursor()
         ui.update(cam)
         
         pygame.display.update()
\ No newline at end of file
@@ -0,0 +1,136 @@
+import math
+import pygame
+from collections import OrderedDict
+
+# Python TileMap object
+# A tile map layer that pre-renders fixed size chunks of tiles into surfaces and draws them with the 2D camera controller
+# Chunks are rendered when they come into view, re-rendered only when their tiles change,
+# and the furthest chunks from the camera are evicted when over the memory budget
+# Dependencies : math, pygame, collections, personallib.camera
+class TileMap:
+    def __init__(self, tileSize, tiles, chunkSize=16, maxBytes=32 * 1024 * 1024):
+        self.tileSize = tileSize                # Size of each tile in world units, and in pixels on chunk surfaces
+        self.tiles = tiles                      # Maps tile ids to a colour or a surface to draw for that tile
+        self.chunkSize = chunkSize              # Number of tiles along each side of a chunk
+        self.maxBytes = maxBytes                # Memory budget for rendered chunk surfaces in bytes
+        self.chunkTiles = {}                    # Maps chunk coordinates to a dictionary of tile coordinates to tile ids
+        self.chunks = OrderedDict()             # Maps chunk coordinates to rendered surfaces, least recently drawn first
+        self.dirty = set()                      # Chunks whose tiles have changed since they were rendered
+        self.bytes = 0                          # Memory currently used by rendered chunks
+        self.caches = []                        # Camera surface caches that may hold scaled copies of chunks
+        self.renders = 0                        # Number of chunk renders, for measuring streaming cost
+
+    # Sets the tile at a tile coordinate, or removes it if the id is None
+    def set_tile(self, x, y, tile):
+        chunk = (x // self.chunkSize, y // self.chunkSize)
+        tiles = self.chunkTiles.get(chunk)
+        if tile is None:
+            if tiles is None or tiles.pop((x, y), None) is None:
+                return
+            if not tiles:
+                # Empty chunks are not drawn, so their surfaces are dropped too
+                del self.chunkTiles[chunk]
+                if chunk in self.chunks:
+                    self._remove(chunk)
+                return
+        else:
+            if tiles is None:
+                tiles = self.chunkTiles[chunk] = {}
+            elif tiles.get((x, y)) == tile:
+                return
+            tiles[(x, y)] = tile
+        if chunk in self.chunks:
+            self.dirty.add(chunk)
+
+    # Gets the tile id at a tile coordinate, or None if there is no tile
+    def get_tile(self, x, y):
+        return self.chunkTiles.get((x // self.chunkSize, y // self.chunkSize), {}).get((x, y))
+
+    # Sets tiles from a 2D list of tile ids, with the first tile at a given tile coordinate
+    def load(self, grid, origin=(0, 0)):
+        for j, row in enumerate(grid):
+            for i, tile in enumerate(row):
+                self.set_tile(origin[0] + i, origin[1] + j, tile)
+
+    # Gets the tile coordinate containing a world coordinate
+    def get_tile_coord(self, coord):
+        return (math.floor(coord[0] / self.tileSize), math.floor(coord[1] / self.tileSize))
+
+    # Draws the chunks visible to a camera, rendering any that are new or changed
+    # Chunks within margin chunks of the view are also rendered ahead of time so that panning doesn't stall
+    # Chunks are drawn with Camera.blit_scaled, which places same sized surfaces on one grid so neighbouring chunks meet at any zoom,
+    # and once a scaled chunk is larger than the window only its visible part is scaled, so high zooms cost no more than low ones
+    def draw(self, cam, margin=0):
+        if cam.surfaceCache not in self.caches:
+            self.caches.append(cam.surfaceCache)
+        chunkWorld = self.chunkSize * self.tileSize
+        left, top, right, bottom = cam.get_view_bounds()
+        minX = math.floor(left / chunkWorld)
+        minY = math.floor(top / chunkWorld)
+        maxX = math.floor(right / chunkWorld)
+        maxY = math.floor(bottom / chunkWorld)
+        for cx in range(minX - margin, maxX + margin + 1):
+            for cy in range(minY - margin, maxY + margin + 1):
+                chunk = (cx, cy)
+                if chunk not in self.chunkTiles:
+                    continue
+                surface = self.get_chunk(chunk)
+                if minX <= cx <= maxX and minY <= cy <= maxY:
+                    cam.blit_scaled(surface, (cx * chunkWorld, cy * chunkWorld))
+        self._evict((cam.x / chunkWorld, cam.y / chunkWorld), (minX - margin, minY - margin, maxX + margin, maxY + margin))
+
+    # Gets the rendered surface for a chunk, rendering it if it is missing or out of date
+    def get_chunk(self, chunk):
+        surface = self.chunks.get(chunk)
+        if surface is None or chunk in self.dirty:
+            surface = self._render(chunk, surface)
+        self.chunks.move_to_end(chunk)
+        return surface
+
+    # Removes every rendered chunk so that they are all rendered again when next drawn
+    def clear_chunks(self):
+        for chunk in list(self.chunks):
+            self._remove(chunk)
+
+    # Renders the tiles of a chunk onto its surface, reusing the previous surface if there is one
+    def _render(self, chunk, surface):
+        size = self.chunkSize * self.tileSize
+        if surface is None:
+            surface = pygame.Surface((size, size), pygame.SRCALPHA)
+            self.chunks[chunk] = surface
+            self.bytes += size * size * surface.get_bytesize()
+        else:
+            surface.fill((0, 0, 0, 0))
+            for cache in self.caches:
+                cache.invalidate(surface)
+        originX = chunk[0] * self.chunkSize
+        originY = chunk[1] * self.chunkSize
+        for (x, y), tile in self.chunkTiles.get(chunk, {}).items():
+            pos = ((x - originX) * self.tileSize, (y - originY) * self.tileSize)
+            image = self.tiles[tile]
+            if isinstance(image, pygame.Surface):
+                surface.blit(image, pos)
+            else:
+                surface.fill(image, (pos[0], pos[1], self.tileSize, self.tileSize))
+        self.dirty.discard(chunk)
+        self.renders += 1
+        return surface
+
+    # Evicts the chunks furthest from the camera until within the memory budget, keeping those in the kept range
+    def _evict(self, centre, keep):
+        if self.bytes <= self.maxBytes:
+            return
+        candidates = [chunk for chunk in self.chunks if not (keep[0] <= chunk[0] <= keep[2] and keep[1] <= chunk[1] <= keep[3])]
+        candidates.sort(key=lambda chunk: (chunk[0] + 0.5 - centre[0]) ** 2 + (chunk[1] + 0.5 - centre[1]) ** 2, reverse=True)
+        for chunk in candidates:
+            if self.bytes <= self.maxBytes:
+                break
+            self._remove(chunk)
+
+    # Removes a rendered chunk and any scaled copies of it
+    def _remove(self, chunk):
+        surface = self.chunks.pop(chunk)
+        self.bytes -= surface.get_width() * surface.get_height() * surface.get_bytesize()
+        self.dirty.discard(chunk)
+        for cache in self.caches:
+            cache.invalidate(surface)